@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import torch
 import torch.nn.functional as F
 # from torch.backends import cudnn
@@ -9,6 +8,7 @@ from fast_reid.fastreid.config import get_cfg
 from fast_reid.fastreid.modeling.meta_arch import build_model
 from fast_reid.fastreid.utils.checkpoint import Checkpointer
 from fast_reid.fastreid.engine import DefaultTrainer, default_argument_parser, default_setup, launch
+from tracker.crops import FrameCrops
 
 # cudnn.benchmark = True
 
@@ -50,12 +50,17 @@ def preprocess(image, input_size):
 
 
 class FastReIDInterface:
-    def __init__(self, config_file, weights_path, device, batch_size=8):
+    def __init__(self, config_file, weights_path, device, batch_size=32, half=None):
         super(FastReIDInterface, self).__init__()
 
-        self.device = device
+        self.device = torch.device(device)
         self.batch_size = batch_size
 
+        # FP16 on GPU, FP32 on CPU unless requested otherwise
+        if half is None:
+            half = self.device.type == 'cuda'
+        self.dtype = torch.float16 if half else torch.float32
+
         self.cfg = setup_cfg(config_file, ['MODEL.WEIGHTS', weights_path])
 
         self.model = build_model(self.cfg)
@@ -63,83 +68,44 @@ class FastReIDInterface:
 
         Checkpointer(self.model).load(weights_path)
 
-        self.model = self.model.eval().to(device=self.device).half()
+        self.model = self.model.eval().to(device=self.device, dtype=self.dtype)
 
         self.pH, self.pW = self.cfg.INPUT.SIZE_TEST
 
-    def inference(self, image, detections):
+    def inference(self, image, detections, crops=None):
+        """
+        Embeddings of the detections of an image, as an N x D float32 array.
+
+        The image is uploaded once and every patch is cropped and resized to
+        INPUT.SIZE_TEST in one batched op. `crops` optionally holds the already
+        extracted crops of the detections (a `tracker.crops.FrameCrops`). The
+        model then runs over batches of at most `batch_size` patches.
+        """
 
         if detections is None or np.size(detections) == 0:
             return []
 
-        H, W, _ = np.shape(image)
-
-        batch_patches = []
-        patches = []
-        for d in range(np.size(detections, 0)):
-            tlbr = detections[d, :4].astype(np.int_)
-            tlbr[0] = max(0, tlbr[0])
-            tlbr[1] = max(0, tlbr[1])
-            tlbr[2] = min(W - 1, tlbr[2])
-            tlbr[3] = min(H - 1, tlbr[3])
-            patch = image[tlbr[1]:tlbr[3], tlbr[0]:tlbr[2], :]
-
-            # the model expects RGB inputs
-            patch = patch[:, :, ::-1]
-
-            # Apply pre-processing to image.
-            patch = cv2.resize(patch, tuple(self.cfg.INPUT.SIZE_TEST[::-1]), interpolation=cv2.INTER_LINEAR)
-            # patch, scale = preprocess(patch, self.cfg.INPUT.SIZE_TEST[::-1])
-
-            # plt.figure()
-            # plt.imshow(patch)
-            # plt.show()
-
-            # Make shape with a new batch dimension which is adapted for network input
-            patch = torch.as_tensor(patch.astype("float32").transpose(2, 0, 1))
-            patch = patch.to(device=self.device).half()
-
-            patches.append(patch)
-
-            if (d + 1) % self.batch_size == 0:
-                patches = torch.stack(patches, dim=0)
-                batch_patches.append(patches)
-                patches = []
-
-        if len(patches):
-            patches = torch.stack(patches, dim=0)
-            batch_patches.append(patches)
-
-        features = np.zeros((0, 2048))
-        # features = np.zeros((0, 768))
-
-        for patches in batch_patches:
-
-            # Run model
-            patches_ = torch.clone(patches)
-            pred = self.model(patches)
-            pred[torch.isinf(pred)] = 1.0
-
-            feat = postprocess(pred)
-
-            nans = np.isnan(np.sum(feat, axis=1))
-            if np.isnan(feat).any():
-                for n in range(np.size(nans)):
-                    if nans[n]:
-                        # patch_np = patches[n, ...].squeeze().transpose(1, 2, 0).cpu().numpy()
-                        patch_np = patches_[n, ...]
-                        patch_np_ = torch.unsqueeze(patch_np, 0)
-                        pred_ = self.model(patch_np_)
-
-                        patch_np = torch.squeeze(patch_np).cpu()
-                        patch_np = torch.permute(patch_np, (1, 2, 0)).int()
-                        patch_np = patch_np.numpy()
-
-                        plt.figure()
-                        plt.imshow(patch_np)
-                        plt.show()
-
-            features = np.vstack((features, feat))
+        if crops is None:
+            H, W, _ = np.shape(image)
+            tlbr = detections[:, :4].astype(np.int_)
+            tlbr[:, :2] = np.maximum(tlbr[:, :2], 0)
+            tlbr[:, 2] = np.minimum(tlbr[:, 2], W - 1)
+            tlbr[:, 3] = np.minimum(tlbr[:, 3], H - 1)
+            crops = FrameCrops(image, tlbr, self.device)
+
+        # the model expects RGB inputs, which the crops are
+        patches = crops.resized((self.pH, self.pW)).to(device=self.device, dtype=self.dtype)
+
+        features = None
+        with torch.no_grad():
+            for start in range(0, len(patches), self.batch_size):
+                # Run model
+                pred = self.model(patches[start:start + self.batch_size])
+                pred[torch.isinf(pred)] = 1.0
+
+                feat = postprocess(pred)
+                if features is None:
+                    features = np.empty((len(patches), feat.shape[1]), dtype=np.float32)
+                features[start:start + len(feat)] = feat
 
         return features
-
@@ -2,21 +2,102 @@ import json
 import os
 import os.path as osp
 import cv2
+import numpy as np
 import torch
 
 from yolox.exp import get_exp
-from yolox.data.data_augment import preproc
-from yolox.utils import fuse_model, get_model_info, postprocess
+from yolox.data.data_augment import Letterbox
+from yolox.utils import fuse_model, get_model_info, TorchBackend
+
+
+class ModelRegistry(object):
+    """
+    Player classification models and metadata, loaded on first use and then
+    cached for the lifetime of the process (so each worker of a process pool
+    loads them once). Call `load()` to pay the loading cost up front, and
+    `configure()` before that to change the device or the model paths.
+    """
+
+    def __init__(self, device=None,
+                 feature_extractor_path='google/vit-base-patch16-224-in21k',
+                 classifier_path='/datadrive/player-classifier/vit-base-beans-demo-v5/',
+                 player_classifier_path='/datadrive/player-classifier/game2-classifier_players',
+                 meta_path='meta.json'):
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+        self.paths = {
+            'feature_extractor': feature_extractor_path,
+            'classifier': classifier_path,
+            'player_classifier': player_classifier_path,
+            'meta': meta_path,
+        }
+        self._loaded = {}
+
+    def configure(self, device=None, **paths):
+        """Change the device and/or model paths. Models already loaded are moved, or reloaded if their path changed."""
+        for name, path in paths.items():
+            if name not in self.paths:
+                raise KeyError("Unknown model: " + name)
+            if path != self.paths[name]:
+                self.paths[name] = path
+                self._loaded.pop(name, None)
+        if device is not None:
+            self.device = torch.device(device)
+            for name in ['classifier', 'player_classifier']:
+                if name in self._loaded:
+                    self._loaded[name].to(self.device)
+        return self
+
+    def load(self):
+        """Load every model now, instead of on first use."""
+        for name in self.paths:
+            self.get(name)
+        return self
+
+    def get(self, name):
+        if name not in self._loaded:
+            self._loaded[name] = self._load(name)
+        return self._loaded[name]
+
+    def _load(self, name):
+        path = self.paths[name]
+        if name == 'meta':
+            with open(path) as meta_file:
+                return json.load(meta_file)
+
+        from transformers import ViTForImageClassification, ViTFeatureExtractor
+        if name == 'feature_extractor':
+            return ViTFeatureExtractor.from_pretrained(path)
+        return ViTForImageClassification.from_pretrained(path).to(self.device).eval()
+
+    @property
+    def feature_extractor(self):
+        return self.get('feature_extractor')
+
+    @property
+    def classifier(self):
+        return self.get('classifier')
+
+    @property
+    def player_classifier(self):
+        return self.get('player_classifier')
+
+    @property
+    def meta(self):
+        return self.get('meta')
+
 
-from transformers import ViTForImageClassification, TrainingArguments, Trainer, ViTFeatureExtractor
-from transformers.models.vit.feature_extraction_vit import ViTFeatureExtractor 
 # Player classification
-feature_extractor: ViTFeatureExtractor = ViTFeatureExtractor.from_pretrained('google/vit-base-patch16-224-in21k')
-classifier = ViTForImageClassification.from_pretrained('/datadrive/player-classifier/vit-base-beans-demo-v5/')
-classifier.cuda()
+models = ModelRegistry()
+
+
+def __getattr__(name):
+    # Keep `predictor.classifier` and the like working, without loading at import
+    if name in models.paths:
+        return models.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-player_classifier = ViTForImageClassification.from_pretrained('/datadrive/player-classifier/game2-classifier_players')
-player_classifier.cuda()
 
 class Predictor(object):
     def __init__(
@@ -26,7 +107,8 @@ class Predictor(object):
         trt_file=None,
         decoder=None,
         device=torch.device("cpu"),
-        fp16=False
+        fp16=False,
+        backend=None
     ):
         self.model = model
         self.decoder = decoder
@@ -38,6 +120,13 @@ class Predictor(object):
         self.fp16 = fp16
         self.rgb_means = (0.485, 0.456, 0.406)
         self.std = (0.229, 0.224, 0.225)
+        self.letterbox = Letterbox(self.test_size, self.rgb_means, self.std)
+        self._batch = None
+
+        # Anything that maps a preprocessed batch to per-image detections, see yolox.utils.backends
+        if backend is None:
+            backend = TorchBackend(self.model, self.num_classes, self.confthre, self.nmsthre, device, fp16, decoder)
+        self.backend = backend
 
     def inference(self, img, timer):
         img_info = {"id": 0}
@@ -52,23 +141,49 @@ class Predictor(object):
         img_info["width"] = width
         img_info["raw_img"] = img
 
-        img, ratio = preproc(img, self.test_size, self.rgb_means, self.std)
-        img_info["ratio"] = ratio
-        img = torch.from_numpy(img).unsqueeze(0).float().to(self.device)
-        if self.fp16:
-            img = img.half()  # to FP16
-
-        with torch.no_grad():
-            timer.tic()
-            outputs = self.model(img)
-            if self.decoder is not None:
-                outputs = self.decoder(outputs, dtype=outputs.type())
-            outputs = postprocess(
-                outputs, self.num_classes, self.confthre, self.nmsthre
-            )
-            #logger.info("Infer time: {:.4f}s".format(time.time() - t0))
+        batch = self._batch_buffer(1)
+        _, img_info["ratio"] = self.letterbox(img, out=batch[0])
+
+        timer.tic()
+        outputs = self.backend(batch)
+        #logger.info("Infer time: {:.4f}s".format(time.time() - t0))
         return outputs, img_info
 
+    def inference_batch(self, imgs, timer):
+        """
+        Run the detector once on a batch of images (arrays or paths). Returns
+        the `(outputs, img_info)` pair of each image, in order, as `inference`
+        returns them one at a time.
+        """
+        batch = self._batch_buffer(len(imgs))
+        img_infos = []
+        for i, img in enumerate(imgs):
+            img_info = {"id": i}
+            if isinstance(img, str):
+                img_info["file_name"] = osp.basename(img)
+                img = cv2.imread(img)
+            else:
+                img_info["file_name"] = None
+
+            height, width = img.shape[:2]
+            img_info["height"] = height
+            img_info["width"] = width
+            img_info["raw_img"] = img
+
+            _, img_info["ratio"] = self.letterbox(img, out=batch[i])
+            img_infos.append(img_info)
+
+        timer.tic()
+        outputs = self.backend(batch)
+        return [([output], img_info) for output, img_info in zip(outputs, img_infos)]
+
+    def _batch_buffer(self, batch_size):
+        # Letterboxed inputs are written into one reusable (pinned, for GPU) host tensor
+        if self._batch is None or len(self._batch) < batch_size:
+            self._batch = torch.empty((batch_size, 3) + tuple(self.test_size), dtype=torch.float32,
+                                      pin_memory=self.device.type == 'cuda')
+        return self._batch[:batch_size]
+
 
 def get_predictor():
     exp = get_exp(osp.join('../ByteTrack', 'exps/example/mot/yolox_x_mix_det.py'), None)
@@ -92,16 +207,62 @@ def get_predictor():
 
 def is_player(img: cv2.Mat) -> bool:
     img_converted = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    features = feature_extractor([img_converted], return_tensors="pt")
-    predictions = classifier(**{ k:v.cuda() for k,v in features.items() })
+    features = models.feature_extractor([img_converted], return_tensors="pt")
+    predictions = models.classifier(**{ k:v.to(models.device) for k,v in features.items() })
     return bool(predictions.logits.cpu().argmax() == 1)
 
-with open('meta.json') as meta_file:
-    meta = json.load(meta_file)
-
 def classify_player(img: cv2.Mat):
     img_converted = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    features = feature_extractor([img_converted], return_tensors="pt")
-    predictions = player_classifier(**{ k:v.cuda() for k,v in features.items() })
+    features = models.feature_extractor([img_converted], return_tensors="pt")
+    predictions = models.player_classifier(**{ k:v.to(models.device) for k,v in features.items() })
     # player_mapping = { v:k for k, v in meta[game_id][video_id]['id_maps'].items() }
-    return int(predictions.logits.cpu().argmax())
\ No newline at end of file
+    return int(predictions.logits.cpu().argmax())
+
+def classify_crops(crops, classifier=None, player_classifier=None, feature_extractor=None):
+    """
+    Player / non-player and player id of RGB crops, with one feature extraction
+    and one batched forward per model. Returns `is_player` (bool) and `player_ids`
+    (int, -1 for non-players) arrays aligned to `crops`. Models default to
+    those of the registry.
+    """
+    if len(crops) == 0:
+        return np.zeros((0,), dtype=bool), np.zeros((0,), dtype=np.int64)
+
+    if feature_extractor is None:
+        feature_extractor = models.feature_extractor
+
+    pixel_values = feature_extractor(crops, return_tensors="pt")['pixel_values'].to(models.device)
+    return classify_pixel_values(pixel_values, classifier, player_classifier)
+
+def vit_pixel_values(frame_crops, feature_extractor=None):
+    """
+    ViT inputs of the crops of a `tracker.crops.FrameCrops`, resized and normalised as the feature extractor would.
+    Crops are averaged over each output pixel, as the antialiased PIL resize of the feature extractor.
+    """
+    if feature_extractor is None:
+        feature_extractor = models.feature_extractor
+
+    size = feature_extractor.size
+    size = (size["height"], size["width"]) if isinstance(size, dict) else (size, size)
+    mean = torch.tensor(feature_extractor.image_mean, device=frame_crops.device).view(1, 3, 1, 1)
+    std = torch.tensor(feature_extractor.image_std, device=frame_crops.device).view(1, 3, 1, 1)
+    return ((frame_crops.resized(size, sampling_ratio=-1) / 255.0 - mean) / std).to(models.device)
+
+def classify_pixel_values(pixel_values, classifier=None, player_classifier=None):
+    """`classify_crops` on ViT inputs that were already extracted."""
+    if len(pixel_values) == 0:
+        return np.zeros((0,), dtype=bool), np.zeros((0,), dtype=np.int64)
+
+    if classifier is None:
+        classifier = models.classifier
+    if player_classifier is None:
+        player_classifier = models.player_classifier
+
+    with torch.no_grad():
+        is_player = classifier(pixel_values=pixel_values).logits.argmax(-1) == 1
+        player_ids = torch.full((len(pixel_values),), -1, dtype=torch.int64, device=pixel_values.device)
+        if is_player.any():
+            # The player classifier has always received the crops in BGR order (see classify_player),
+            # flipping the channels of the normalised pixels is equivalent to extracting them again
+            player_ids[is_player] = player_classifier(pixel_values=pixel_values[is_player].flip(1)).logits.argmax(-1)
+    return is_player.cpu().numpy(), player_ids.cpu().numpy()
@@ -0,0 +1,31 @@
+import sys
+import argparse
+
+from loguru import logger
+
+sys.path.append('.')
+
+from tracker.results import RESULTS_EXT, is_binary_results, mot_to_results, results_to_mot
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("Convert tracking results")
+    parser.add_argument("src", help="results to convert: MOTChallenge text (.txt) or binary (" + RESULTS_EXT + ")")
+    parser.add_argument("dst", help="converted results, in the other format")
+    parser.add_argument("--decimals", default=2, type=int, help="decimals of the boxes in MOTChallenge text")
+    parser.add_argument("--chunk-size", dest="chunk_size", default=4096, type=int, help="rows written at once in the binary format")
+
+    return parser
+
+
+def main(args):
+    if is_binary_results(args.src):
+        results_to_mot(args.src, args.dst, args.decimals)
+    else:
+        mot_to_results(args.src, args.dst, args.chunk_size)
+    logger.info(f"{args.src} converted to {args.dst}")
+
+
+if __name__ == "__main__":
+    args = make_parser().parse_args()
+    main(args)
@@ -4,13 +4,12 @@ import os
 import os.path as osp
 import time
 import json
+from functools import partial
 from typing import List, Dict, Tuple
 import cv2
 import numpy as np
 from numpy import number
 import torch
-from transformers import ViTForImageClassification, ViTFeatureExtractor
-import traceback
 
 from loguru import logger
 
@@ -18,12 +17,19 @@ sys.path.append('/home/jerry/nba-BoT-SORT')
 sys.path.remove('/home/ztchen/BoT-SORT')
 print(sys.path)
 
-from predictor import classify_player
-from yolox.data.data_augment import preproc
+from predictor import classify_pixel_values, vit_pixel_values, models
+from yolox.data.data_augment import Letterbox
 from yolox.exp import get_exp
-from yolox.utils import fuse_model, get_model_info, postprocess
+from yolox.utils import fuse_model, get_model_info, TorchBackend, ONNXBackend
 from yolox.utils.visualize import plot_tracking
 from tracker.bot_sort import BoTSORT
+from tracker.crops import FrameCrops
+from tracker.checkpoint import load_checkpoint, save_checkpoint
+from tracker.gmc import gmc_cache_file
+from tracker.keyframes import KeyframeScheduler
+from tracker.pipeline import Pipeline
+from tracker.results import RESULTS_EXT, open_results, truncate_results
+from tracker.segments import TrackletFeatures
 from tracker.tracking_utils.timer import Timer
 
 IMAGE_EXT = [".jpg", ".jpeg", ".webp", ".bmp", ".png"]
@@ -46,6 +52,11 @@ def make_parser():
     parser.add_argument("--fps", default=30, type=int, help="frame rate (fps)")
     parser.add_argument("--fp16", dest="fp16", default=False, action="store_true",help="Adopting mix precision evaluating.")
     parser.add_argument("--fuse", dest="fuse", default=False, action="store_true", help="Fuse conv and bn for testing.")
+    parser.add_argument("--det-batch", dest="det_batch", default=1, type=int, help="frames per detector forward pass in the video demo")
+    parser.add_argument("--backend", default="torch", type=str, help="detector backend: torch | onnx")
+    parser.add_argument("--onnx-model", dest="onnx_model", default=None, type=str, help="YOLOX model exported by tools/export_onnx.py, for --backend onnx")
+    parser.add_argument("--intra-op-threads", dest="intra_op_threads", default=0, type=int, help="onnxruntime intra-op threads (0: default)")
+    parser.add_argument("--inter-op-threads", dest="inter_op_threads", default=0, type=int, help="onnxruntime inter-op threads (0: default)")
     parser.add_argument("--trt", dest="trt", default=False, action="store_true", help="Using TensorRT model for testing.")
 
     # Gt bbox
@@ -64,7 +75,10 @@ def make_parser():
     parser.add_argument("--fuse-score", dest="fuse_score", default=False, action="store_true", help="fuse score and iou for association")
 
     # CMC
-    parser.add_argument("--cmc-method", default="orb", type=str, help="cmc method: files (Vidstab GMC) | orb | ecc")
+    parser.add_argument("--cmc-method", default="orb", type=str, help="cmc method: files (Vidstab GMC) | orb | ecc | sparseOptFlow | cache (tools/precompute_gmc.py)")
+    parser.add_argument("--gmc-cache", dest="gmc_cache", default=r"tracker/GMC_files/cache", type=str, help="directory of the precomputed GMC caches, for --cmc-method cache")
+    parser.add_argument("--gmc-cache-method", dest="gmc_cache_method", default="sparseOptFlow", type=str, help="cmc method the GMC cache was precomputed with, for --cmc-method cache")
+    parser.add_argument("--gmc-cache-downscale", dest="gmc_cache_downscale", default=2, type=int, help="downscale the GMC cache was precomputed with, for --cmc-method cache")
 
     # ReID
     parser.add_argument("--with-reid", dest="with_reid", default=False, action="store_true", help="test mot20.")
@@ -72,6 +86,21 @@ def make_parser():
     parser.add_argument("--fast-reid-weights", dest="fast_reid_weights", default=r"pretrained/mot17_sbs_S50.pth", type=str,help="reid config file path")
     parser.add_argument('--proximity_thresh', type=float, default=0.5, help='threshold for rejecting low overlap reid matches')
     parser.add_argument('--appearance_thresh', type=float, default=0.25, help='threshold for rejecting low appearance similarity reid matches')
+    parser.add_argument('--feat-history', dest='feat_history', type=int, default=50, help='number of past appearance features kept per track (0 disables the history)')
+    parser.add_argument('--removed-retention', dest='removed_retention', type=int, default=0, help='frames a removed track id is remembered (0: until the bounded archive overwrites it)')
+    parser.add_argument('--det-interval', dest='det_interval', type=int, default=1, help='keyframe mode: run the detector, classifiers and ReID every k frames, and only propagate the tracks in between')
+    parser.add_argument('--max-motion', dest='max_motion', type=float, default=0, help='keyframe mode: also detect frames where the camera moved more than this many pixels (0: off)')
+    parser.add_argument('--low-conf-ratio', dest='low_conf_ratio', type=float, default=0, help='keyframe mode: also detect when more than this fraction of the tracks have a low confidence (0: off)')
+    parser.add_argument('--checkpoint', default=None, type=str, help='file where the tracker state is saved periodically and at the end, to resume with --resume')
+    parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=int, default=1000, help='frames between two tracker checkpoints')
+    parser.add_argument('--resume', default=None, type=str, help='tracker checkpoint to resume from, at the frame after it')
+    parser.add_argument('--result-format', dest='result_format', default='txt', type=str, help='results format: txt (MOTChallenge) | trk (binary, see tracker/results.py)')
+    parser.add_argument('--start-frame', dest='start_frame', type=int, default=0, help='first frame of the video to track')
+    parser.add_argument('--end-frame', dest='end_frame', type=int, default=None, help='frame of the video where tracking stops (excluded)')
+    parser.add_argument('--tracklet-features', dest='tracklet_features', type=int, default=0, help='save the appearance of the tracks of the first and last N frames, for tools/segment_track.py (0: off)')
+    parser.add_argument('--queue-size', dest='queue_size', type=int, default=32, help='frames buffered in front of each pipeline stage')
+    parser.add_argument('--render-workers', dest='render_workers', type=int, default=2, help='threads drawing the tracks on the frames')
+    parser.add_argument('--report-interval', dest='report_interval', type=int, default=500, help='frames between two reports of the pipeline stage occupancy')
     return parser
 
 
@@ -86,17 +115,24 @@ def get_image_list(path):
     return image_names
 
 
-def write_results(filename, results):
-    save_format = '{frame},{id},{x1},{y1},{w},{h},{s},-1,-1,-1\n'
-    with open(filename, 'w') as f:
-        for frame_id, tlwhs, track_ids, scores in results:
-            for tlwh, track_id, score in zip(tlwhs, track_ids, scores):
-                if track_id < 0:
-                    continue
-                x1, y1, w, h = tlwh
-                line = save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1), w=round(w, 1), h=round(h, 1), s=round(score, 2))
-                f.write(line)
-    logger.info('save results to {}'.format(filename))
+def seek_frame(cap, frame_id):
+    """
+    Move `cap`, just opened, to frame `frame_id`. Seeking with CAP_PROP_POS_FRAMES
+    may land on a nearby keyframe of compressed videos, so the frames before it are grabbed.
+    """
+    for i in range(frame_id):
+        if not cap.grab():
+            raise ValueError("Error: the video ends at frame {}, before frame {}".format(i, frame_id))
+
+
+def read_frames(cap, frame_id=0, stop=None):
+    """Yield the frames of `cap`, as pipeline items with their index (from `frame_id`), until the end of the stream or `stop`."""
+    while stop is None or frame_id < stop:
+        ret_val, frame = cap.read()
+        if not ret_val:
+            return
+        yield {'frame_id': frame_id, 'frame': frame}
+        frame_id += 1
 
 
 class Predictor(object):
@@ -107,7 +143,8 @@ class Predictor(object):
         trt_file=None,
         decoder=None,
         device=torch.device("cpu"),
-        fp16=False
+        fp16=False,
+        backend=None
     ):
         self.model = model
         self.decoder = decoder
@@ -128,6 +165,13 @@ class Predictor(object):
             self.model = model_trt
         self.rgb_means = (0.485, 0.456, 0.406)
         self.std = (0.229, 0.224, 0.225)
+        self.letterbox = Letterbox(self.test_size, self.rgb_means, self.std)
+        self._batch = None
+
+        # Anything that maps a preprocessed batch to per-image detections, see yolox.utils.backends
+        if backend is None:
+            backend = TorchBackend(self.model, self.num_classes, self.confthre, self.nmsthre, device, fp16, decoder)
+        self.backend = backend
 
     def inference(self, img, timer):
         img_info = {"id": 0}
@@ -142,20 +186,48 @@ class Predictor(object):
         img_info["width"] = width
         img_info["raw_img"] = img
 
-        img, ratio = preproc(img, self.test_size, self.rgb_means, self.std)
-        img_info["ratio"] = ratio
-        img = torch.from_numpy(img).unsqueeze(0).float().to(self.device)
-        if self.fp16:
-            img = img.half()  # to FP16
-
-        with torch.no_grad():
-            timer.tic()
-            outputs = self.model(img)
-            if self.decoder is not None:
-                outputs = self.decoder(outputs, dtype=outputs.type())
-            outputs = postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
+        batch = self._batch_buffer(1)
+        _, img_info["ratio"] = self.letterbox(img, out=batch[0])
+
+        timer.tic()
+        outputs = self.backend(batch)
         return outputs, img_info
 
+    def inference_batch(self, imgs, timer):
+        """
+        Run the detector once on a batch of images (arrays or paths). Returns
+        the `(outputs, img_info)` pair of each image, in order, as `inference`
+        returns them one at a time.
+        """
+        batch = self._batch_buffer(len(imgs))
+        img_infos = []
+        for i, img in enumerate(imgs):
+            img_info = {"id": i}
+            if isinstance(img, str):
+                img_info["file_name"] = osp.basename(img)
+                img = cv2.imread(img)
+            else:
+                img_info["file_name"] = None
+
+            height, width = img.shape[:2]
+            img_info["height"] = height
+            img_info["width"] = width
+            img_info["raw_img"] = img
+
+            _, img_info["ratio"] = self.letterbox(img, out=batch[i])
+            img_infos.append(img_info)
+
+        timer.tic()
+        outputs = self.backend(batch)
+        return [([output], img_info) for output, img_info in zip(outputs, img_infos)]
+
+    def _batch_buffer(self, batch_size):
+        # Letterboxed inputs are written into one reusable (pinned, for GPU) host tensor
+        if self._batch is None or len(self._batch) < batch_size:
+            self._batch = torch.empty((batch_size, 3) + tuple(self.test_size), dtype=torch.float32,
+                                      pin_memory=self.device.type == 'cuda')
+        return self._batch[:batch_size]
+
 
 def image_demo(predictor, vis_folder, current_time, args):
     if osp.isdir(args.path):
@@ -243,165 +315,247 @@ def imageflow_demo(predictor, vis_folder, gt_bboxes: Dict[int,
     save_folder = osp.join(args.out, osp.basename(args.path)[:-len('.mp4')])
     os.makedirs(save_folder, exist_ok=True)
     save_path = osp.join(save_folder, f"{osp.basename(args.path)[:-len('.mp4')]}_tracking.mp4")
+    res_name = osp.join(save_folder, f"{osp.basename(args.path)[:-len('.mp4')]}_tracking")
+    res_file = res_name + (RESULTS_EXT if args.result_format == 'trk' else '.txt')
+
+    start_frame = args.start_frame
+    if args.resume is not None:
+        checkpoint = load_checkpoint(args.resume)
+        start_frame = checkpoint['frame_index'] + 1
+        logger.info(f"resuming from frame {start_frame} of {args.resume}")
+        # The video of the resumed part is saved separately, the results are appended
+        save_path = save_path[:-len('.mp4')] + f"_{start_frame}.mp4"
+        truncate_results(res_file, start_frame - 1)
+    # Frame ids, and a restored tracker and GMC state, must be paired with the frames read exactly
+    seek_frame(cap, start_frame)
     logger.info(f"video save_path is {save_path}")
 
     vid_writer = cv2.VideoWriter(
         save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (int(width), int(height))
     )
+    if args.cmc_method == 'cache':
+        args.gmc_cache_file = gmc_cache_file(args.gmc_cache, args.path, args.gmc_cache_method, args.gmc_cache_downscale)
     tracker = BoTSORT(args, frame_rate=args.fps)
+    if args.resume is not None:
+        tracker.load_state_dict(checkpoint['tracker'])
     timer = Timer()
     # frame_id = 0
     
     #
     model_name_or_path = 'google/vit-base-patch16-224-in21k'
-    feature_extractor = ViTFeatureExtractor.from_pretrained(model_name_or_path)
     # classifier = ViTForImageClassification.from_pretrained('/datadrive/player-classifier/game1-classifier/')
-    classifier = ViTForImageClassification.from_pretrained(args.cls)
-    classifier.eval().cuda()
+    models.configure(device=args.device, feature_extractor=model_name_or_path,
+                     classifier=args.cls or models.paths['classifier']).load()
+    feature_extractor = models.feature_extractor
+    classifier = models.classifier
     
-    ims_to_process = []
-    while True:
-        ret_val, frame = cap.read()
-        if ret_val:
-            ims_to_process.append(frame)
-        else:
-            break
-    
-    results = []
-    ims_to_write = []
-    for frame_id, frame in enumerate(ims_to_process):
-    
-    # while True:
-        if frame_id % 20 == 0:
-            logger.info('Processing frame {} ({:.2f} fps)'.format(frame_id, 1. / max(1e-5, timer.average_time)))
-        # ret_val, frame = cap.read()
-        # if ret_val:
-        detections = None
-        gt_ids = None
+    # Decode, detect, estimate the camera motion, track and render concurrently, through bounded queues
+    timer.tic()
+    pipeline = Pipeline(read_frames(cap, start_frame, args.end_frame), queue_size=args.queue_size)
+    keyframes = KeyframeScheduler(args.det_interval, args.max_motion, args.low_conf_ratio)
+    if args.resume is not None:
+        keyframes.tracked_low_conf = tracker.low_confidence_ratio()
+    detect = partial(detect_frames, predictor=predictor, tracker=tracker, feature_extractor=feature_extractor,
+                     classifier=classifier, gt_bboxes=gt_bboxes, args=args, timer=Timer())
+    if keyframes.enabled:
+        # The camera motion of every frame is needed to pick the keyframes, ahead of the detector.
+        # The tracker runs a few frames behind, so the low confidence trigger reacts with that delay.
+        pipeline.add('gmc', partial(estimate_camera_motion, tracker=tracker, args=args))
+        pipeline.add('detect', partial(detect, keyframes=keyframes), batch_size=args.det_batch)
+    else:
+        pipeline.add('detect', detect, batch_size=args.det_batch)
+        pipeline.add('gmc', partial(estimate_motion, tracker=tracker, args=args))
+    # Appearance of the tracklets at both ends of the video segment, for tools/segment_track.py
+    tracklet_features = TrackletFeatures(start_frame, args.tracklet_features) if args.tracklet_features > 0 else None
+    pipeline.add('track', partial(track_frame, tracker=tracker, timer=timer, args=args, tracklet_features=tracklet_features,
+                                  keyframes=keyframes if keyframes.enabled else None))
+    pipeline.add('render', partial(render_frame, timer=timer), workers=args.render_workers)
+
+    res = open_results(res_file, append=args.resume is not None) if args.save_result else None
+    outputs = iter(pipeline)
+    frame_id = start_frame - 1
+    try:
+        for frame_id, online_im, (ids, tlwhs, scores), state in outputs:
+            if frame_id % 20 == 0:
+                logger.info('Processing frame {} ({:.2f} fps)'.format(frame_id, 1. / max(1e-5, timer.average_time)))
+            if args.report_interval > 0 and frame_id % args.report_interval == 0 and frame_id > 0:
+                logger.info('Pipeline: {}'.format(pipeline.report()))
+            if res is not None:
+                vid_writer.write(online_im)
+                # Track ids are player ids
+                res.add(frame_id, ids, tlwhs, scores, player_ids=ids)
+            if state is not None:
+                # Saved once the rows of the frame are written, so a resumed run never misses rows
+                if res is not None:
+                    res.flush()
+                save_checkpoint(args.checkpoint, state)
+        logger.info('Pipeline: {}'.format(pipeline.report()))
+        if args.checkpoint is not None:
+            # Final state, to continue the game in another run
+            save_checkpoint(args.checkpoint, {'frame_index': frame_id, 'tracker': tracker.state_dict()})
+            logger.info(f"tracker state saved to {args.checkpoint}")
+        if tracklet_features is not None:
+            save_checkpoint(res_name + '_features.npz', tracklet_features.state_dict())
+    finally:
+        # Stops and joins the stages before the capture is released
+        outputs.close()
+        cap.release()
+        if res is not None:
+            res.close()
+            logger.info(f"save results to {res_file}")
+        vid_writer.release()
+
+
+def detect_frames(batch, predictor, tracker, feature_extractor, classifier, gt_bboxes, args, timer, keyframes=None):
+    """
+    Model stage: detect a batch of frames, then classify the crops of each frame,
+    and embed its player detections for ReID. `detections` is left to None for
+    frames where nothing was detected.
+
+    In keyframe mode, only the keyframes picked by `keyframes` (a
+    `KeyframeScheduler`) go through the models, and the other frames are marked
+    for propagation.
+    """
+    for item in batch:
+        item.update(detections=None, gt_ids=None, crops=None, features=None, keyframe=True)
+        if keyframes is not None:
+            item['keyframe'] = keyframes(item['frame_id'], item.get('warp'), item['frame'].shape)
+    batch_keyframes = [item for item in batch if item['keyframe']]
+    if not batch_keyframes:
+        return batch
+
+    detected = predictor.inference_batch([item['frame'] for item in batch_keyframes], timer)
+    for item, (outputs, img_info) in zip(batch_keyframes, detected):
+        frame_id, frame = item['frame_id'], item['frame']
         # if frame with GT
         if frame_id in gt_bboxes and False:
-            detections, gt_ids = gt_bboxes[frame_id]
-            img_info = { "raw_img": frame }
-        else:
-            # Detect objects
-            outputs, img_info = predictor.inference(frame, timer)
-            scale = min(exp.test_size[0] / float(img_info['height'], ), exp.test_size[1] / float(img_info['width']))
-
-            if outputs[0] is not None:
-                outputs = outputs[0].cpu().numpy()
-                detections = outputs[:, :7]
-                detections[:, :4] /= scale
-                
-                # do classification
-                if detections.shape[1] == 5:
-                    scores = detections[:, 4]
-                    bboxes = detections[:, :4]
-                    classes = detections[:, -1]
-                else:
-                    scores = detections[:, 4] * detections[:, 5]
-                    bboxes = detections[:, :4]  # x1y1x2y2
-                    classes = detections[:, -1]
-                
-                lowest_inds = scores > tracker.track_low_thresh
-                bboxes = bboxes[lowest_inds]
-                scores = scores[lowest_inds]
-                classes = classes[lowest_inds]
-
-                # player_inds = []
-                patches = []
-                for bIdx, bbox in enumerate(bboxes):                            
-                    # if bbox.min() < 0 or bbox.max() > 1280: continue
-                    x1, y1, x2, y2 = bbox.astype(int)
-                    x1, x2 = np.clip([x1, x2], 0, 1280)
-                    y1, y2 = np.clip([y1, y2], 0, 720)
-                    try:
-                        patch = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB)          
-                        patches.append((bIdx, patch))
-                    except:
-                        print(x1, y1, x2, y2)
-                
-                # if frame_id == 48:
-                #     images = [cv2.cvtColor(patch, cv2.COLOR_RGB2BGR) for _, patch in patches if patch.shape[0] > 1]
-                #     [cv2.imwrite(f'48/{i}.png', img) for (i, img) in enumerate(images)]
-                #     breakpoint()
-                # if frame_id == 11:
-                #     bbox_vis = frame.copy()
-                #     for bIdx, bbox in enumerate(bboxes):
-                #         x1, y1, x2, y2 = bbox.astype(int)
-                #         cv2.rectangle(bbox_vis, [x1, y1], [x2, y2], color=[255,0,0], thickness=2)
-                #     cv2.imwrite('frame11.png', bbox_vis)
-                #     breakpoint()
-                try:
-                    inputs = feature_extractor([patch for _, patch in patches if patch.shape[0] > 1], return_tensors="pt")
-                except Exception as e:
-                    print(e)
-                    print(traceback.format_exc())
-                    print(sys.exc_info()[2])
-                    for _, patch in patches:
-                        print(patch.shape)
-                    return            
-                inputs['pixel_values'] = inputs['pixel_values'].cuda()
-                # print(x1, y1, x2, y2)
-                with torch.no_grad():
-                    logits = classifier(**inputs).logits
-                    
-                tmp = (logits.argmax(-1) == 1).nonzero().squeeze().tolist()
-                player_inds = [patches[i][0] for i in tmp] if isinstance(tmp, list) else [patches[tmp][0]]
-                # print(frame_id, player_inds)
-                # predicted_labels = logits.argmax(-1).cpu().numpy()
-                # player_inds = [bIdx for (bIdx, _), label in zip(patches, labels) if label == 1]
-                # print('#players', player_inds, len(player_inds))
-                detections = detections[player_inds]
-
-                # gt_ids: identify using classifier
-                # video_id = args.path.split('/')[-1][:-len('.mp4')]
-                # game_id = args.path.split('/')[-3]
-                gt_ids = np.array([classify_player(p) for p in [patches[i][1] for i in tmp]])
-
-        # do the tracking
-        if detections is not None:
-            # Run tracker
-            online_targets = tracker.update(detections, gt_ids, img_info["raw_img"])
-
-            online_tlwhs = []
-            online_ids = []
-            online_scores = []
-            for t in online_targets:
-                tlwh = t.tlwh
-                tid = t.track_id
-                # if tid > 9: continue
-                vertical = tlwh[2] / tlwh[3] > args.aspect_ratio_thresh
-                if tlwh[2] * tlwh[3] > args.min_box_area and not vertical:
-                    online_tlwhs.append(tlwh)
-                    online_ids.append(tid)
-                    online_scores.append(t.score)
-                    results.append(
-                        f"{frame_id},{tid},{tlwh[0]:.2f},{tlwh[1]:.2f},{tlwh[2]:.2f},{tlwh[3]:.2f},{t.score:.2f},-1,-1,-1\n"
-                    )
-            timer.toc()
-            online_im = plot_tracking(
-                img_info['raw_img'], online_tlwhs, online_ids, frame_id=frame_id + 1, fps=1. / timer.average_time
-            )
+            item['detections'], item['gt_ids'] = gt_bboxes[frame_id]
+            continue
+        if outputs[0] is None:
+            continue
+
+        scale = min(predictor.test_size[0] / float(img_info['height'], ), predictor.test_size[1] / float(img_info['width']))
+        outputs = outputs[0].cpu().numpy()
+        detections = outputs[:, :7]
+        detections[:, :4] /= scale
+
+        # do classification
+        if detections.shape[1] == 5:
+            scores = detections[:, 4]
+            bboxes = detections[:, :4]
+            classes = detections[:, -1]
         else:
-            timer.toc()
-            online_im = img_info['raw_img']
-
-        ims_to_write.append(online_im)
-            # ch = cv2.waitKey(1)
-            # if ch == 27 or ch == ord("q") or ch == ord("Q"):
-            #     break
-        # else:
-        #     break
-        # frame_id += 1
+            scores = detections[:, 4] * detections[:, 5]
+            bboxes = detections[:, :4]  # x1y1x2y2
+            classes = detections[:, -1]
+
+        lowest_inds = scores > tracker.track_low_thresh
+        bboxes = bboxes[lowest_inds]
+        scores = scores[lowest_inds]
+        classes = classes[lowest_inds]
+
+        # One crop stage per frame, shared by the classifiers and the ReID encoder
+        crops = FrameCrops(frame, bboxes, args.device)
+        crop_inds = np.flatnonzero(crops.valid)
+        # Player / non-player and player id of every crop, in one batched forward per classifier
+        pixel_values = vit_pixel_values(crops.select(crop_inds), feature_extractor)
+        is_player, player_ids = classify_pixel_values(pixel_values, classifier)
+
+        # Crop indices refer to the boxes kept by the low score threshold
+        player_inds = np.flatnonzero(lowest_inds)[crop_inds[is_player]]
+        # print('#players', player_inds, len(player_inds))
+        detections = detections[player_inds]
+        crops = crops.select(crop_inds[is_player])
+
+        # gt_ids: identify using classifier
+        # video_id = args.path.split('/')[-1][:-len('.mp4')]
+        # game_id = args.path.split('/')[-3]
+        item['detections'] = detections
+        item['gt_ids'] = player_ids[is_player]
+
+        # The ReID encoder is stateless, so the embeddings are computed here rather than in the tracker.
+        # The tracker then never reads the crops, which hold a float32 copy of the frame on the device:
+        # they are not queued to the next stages.
+        if args.with_reid:
+            item['features'] = tracker.embed(frame, detections, crops)
+    return batch
+
+
+def is_checkpoint(frame_id, args):
+    return args.checkpoint is not None and args.checkpoint_interval > 0 and (frame_id + 1) % args.checkpoint_interval == 0
+
+
+def estimate_motion(item, tracker, args):
+    """GMC stage: camera motion of a frame, for the tracker. Frames are seen in order, as GMC needs."""
+    item['warp'] = None
+    if item['detections'] is not None:
+        item['warp'] = tracker.estimate_motion(item['frame'], item['detections'], item['frame_id'])
+    # The GMC stage runs ahead of the tracker, so its part of a checkpoint is taken here
+    if is_checkpoint(item['frame_id'], args):
+        item['gmc_state'] = tracker.gmc.state_dict()
+    return item
+
+
+def estimate_camera_motion(item, tracker, args):
+    """GMC stage of keyframe mode: camera motion of every frame, ahead of the detector (so without detections)."""
+    item['warp'] = tracker.gmc.apply(item['frame'], None, frame_index=item['frame_id'])
+    if is_checkpoint(item['frame_id'], args):
+        item['gmc_state'] = tracker.gmc.state_dict()
+    return item
+
+
+def track_frame(item, tracker, timer, args, tracklet_features=None, keyframes=None):
+    """
+    Tracker stage: associate the detections of a frame, strictly in frame order.
+    In keyframe mode, the tracks are propagated through the other frames, and
+    the low confidence ratio of the tracks is published to `keyframes`.
+    """
+    frame_id = item['frame_id']
+    item['tlwhs'], item['ids'], item['scores'] = [], [], []
+    online_targets = None
+    if item['detections'] is not None:
+        online_targets = tracker.update(item['detections'], item['gt_ids'], item['frame'], frame_id, item['crops'],
+                                        features=item['features'], warp=item['warp'])
+    elif args.det_interval > 1:
+        online_targets = tracker.propagate(item['frame'], frame_id, warp=item['warp'])
+
+    item['tracked'] = online_targets is not None
+    if keyframes is not None and keyframes.low_conf_ratio > 0:
+        keyframes.tracked_low_conf = tracker.low_confidence_ratio()
+    if online_targets is not None:
+        if tracklet_features is not None:
+            tracklet_features.update(frame_id, online_targets)
+        for t in online_targets:
+            tlwh = t.tlwh
+            tid = t.track_id
+            # if tid > 9: continue
+            vertical = tlwh[2] / tlwh[3] > args.aspect_ratio_thresh
+            if tlwh[2] * tlwh[3] > args.min_box_area and not vertical:
+                item['tlwhs'].append(tlwh)
+                item['ids'].append(tid)
+                item['scores'].append(t.score)
+    if is_checkpoint(frame_id, args):
+        state = tracker.state_dict(gmc=False)
+        state['gmc'] = item['gmc_state']
+        item['state'] = {'frame_index': frame_id, 'tracker': state}
+
+    # Frames leave the tracker at the pipeline throughput
+    timer.toc()
+    timer.tic()
+    # Drop the per-frame features before rendering
+    item['features'] = None
+    return item
+
+
+def render_frame(item, timer):
+    """Render stage (thread pool): draw the tracks of a frame."""
+    if not item['tracked']:
+        return item['frame_id'], item['frame'], ([], [], []), item.get('state')
+    online_im = plot_tracking(
+        item['frame'], item['tlwhs'], item['ids'], frame_id=item['frame_id'] + 1, fps=1. / max(1e-5, timer.average_time)
+    )
+    return item['frame_id'], online_im, (item['ids'], item['tlwhs'], item['scores']), item.get('state')
 
-    if args.save_result:
-        for online_im in ims_to_write:
-            vid_writer.write(online_im)
-            
-        res_file = osp.join(save_folder, f"{osp.basename(args.path)[:-len('.mp4')]}_tracking.txt")
-        with open(res_file, 'w') as f:
-            f.writelines(results)
-        logger.info(f"save results to {res_file}")
 
 def main(exp, args):
     if not args.experiment_name:
@@ -427,40 +581,49 @@ def main(exp, args):
     if args.tsize is not None:
         exp.test_size = (args.tsize, args.tsize)
 
-    model = exp.get_model().to(args.device)
-    logger.info("Model Summary: {}".format(get_model_info(model, exp.test_size)))
-    model.eval()
-
-    if not args.trt:
-        if args.ckpt is None:
-            ckpt_file = osp.join(output_dir, "best_ckpt.pth.tar")
-        else:
-            ckpt_file = args.ckpt
-        logger.info("loading checkpoint")
-        ckpt = torch.load(ckpt_file, map_location="cpu")
-        # load the model state dict
-        model.load_state_dict(ckpt["model"])
-        logger.info("loaded checkpoint done.")
-
-    if args.fuse:
-        logger.info("\tFusing model...")
-        model = fuse_model(model)
-
-    if args.fp16:
-        model = model.half()  # to FP16
-
-    if args.trt:
-        assert not args.fuse, "TensorRT model is not support model fusing!"
-        trt_file = osp.join(output_dir, "model_trt.pth")
-        assert osp.exists(
-            trt_file
-        ), "TensorRT model is not found!\n Run python3 tools/trt.py first!"
-        model.head.decode_in_inference = False
-        decoder = model.head.decode_outputs
-        logger.info("Using TensorRT to inference")
-    else:
+    if args.backend == "onnx":
+        logger.info("Using onnxruntime to inference: {}".format(args.onnx_model))
+        backend = ONNXBackend(args.onnx_model, exp.num_classes, exp.test_conf, exp.nmsthre, exp.test_size,
+                              args.intra_op_threads, args.inter_op_threads)
+        model = None
         trt_file = None
         decoder = None
+    else:
+        backend = None
+        model = exp.get_model().to(args.device)
+        logger.info("Model Summary: {}".format(get_model_info(model, exp.test_size)))
+        model.eval()
+
+        if not args.trt:
+            if args.ckpt is None:
+                ckpt_file = osp.join(output_dir, "best_ckpt.pth.tar")
+            else:
+                ckpt_file = args.ckpt
+            logger.info("loading checkpoint")
+            ckpt = torch.load(ckpt_file, map_location="cpu")
+            # load the model state dict
+            model.load_state_dict(ckpt["model"])
+            logger.info("loaded checkpoint done.")
+
+        if args.fuse:
+            logger.info("\tFusing model...")
+            model = fuse_model(model)
+
+        if args.fp16:
+            model = model.half()  # to FP16
+
+        if args.trt:
+            assert not args.fuse, "TensorRT model is not support model fusing!"
+            trt_file = osp.join(output_dir, "model_trt.pth")
+            assert osp.exists(
+                trt_file
+            ), "TensorRT model is not found!\n Run python3 tools/trt.py first!"
+            model.head.decode_in_inference = False
+            decoder = model.head.decode_outputs
+            logger.info("Using TensorRT to inference")
+        else:
+            trt_file = None
+            decoder = None
 
     gtByFrames = {}
     if args.gt_bbox is not None and os.path.exists(args.gt_bbox):
@@ -482,7 +645,7 @@ def main(exp, args):
         for k, v in gtByFrames.items():
             gtByFrames[k] = (np.array(v[0]), np.array(v[1]))
 
-    predictor = Predictor(model, exp, trt_file, decoder, args.device, args.fp16)
+    predictor = Predictor(model, exp, trt_file, decoder, args.device, args.fp16, backend)
 
     current_time = time.localtime()
     if args.demo == "image" or args.demo == "images":
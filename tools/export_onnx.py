@@ -26,6 +26,7 @@ def make_parser():
         "-o", "--opset", default=11, type=int, help="onnx opset version"
     )
     parser.add_argument("--no-onnxsim", action="store_true", help="use onnxsim or not")
+    parser.add_argument("--dynamic", action="store_true", help="export with a dynamic batch size, for batched inference")
     parser.add_argument(
         "-f",
         "--exp_file",
@@ -81,6 +82,7 @@ def main():
         args.output_name,
         input_names=[args.input],
         output_names=[args.output],
+        dynamic_axes={args.input: {0: "batch"}, args.output: {0: "batch"}} if args.dynamic else None,
         opset_version=args.opset,
     )
     logger.info("generated onnx model named {}".format(args.output_name))
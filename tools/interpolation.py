@@ -6,6 +6,8 @@ import glob
 
 sys.path.append('.')
 
+from tracker.results import RESULTS_EXT, read_results
+
 
 def make_parser():
     parser = argparse.ArgumentParser("Interpolation!")
@@ -36,11 +38,14 @@ def write_results_score(filename, results):
 
 
 def dti(txt_path, save_path, n_min=25, n_dti=20):
-    seq_txts = sorted(glob.glob(os.path.join(txt_path, '*.txt')))
+    seq_txts = sorted(glob.glob(os.path.join(txt_path, '*.txt')) + glob.glob(os.path.join(txt_path, '*' + RESULTS_EXT)))
     for seq_txt in seq_txts:
-        seq_name = seq_txt.split('/')[-1]
+        seq_name = os.path.splitext(seq_txt.split('/')[-1])[0] + '.txt'
         print(seq_name)
-        seq_data = np.loadtxt(seq_txt, dtype=np.float64, delimiter=',')
+        if seq_txt.endswith(RESULTS_EXT):
+            seq_data = read_results(seq_txt).to_rows()
+        else:
+            seq_data = np.loadtxt(seq_txt, dtype=np.float64, delimiter=',')
         min_id = int(np.min(seq_data[:, 1]))
         max_id = int(np.max(seq_data[:, 1]))
         seq_results = np.zeros((1, 10), dtype=np.float64)
@@ -16,6 +16,7 @@ from yolox.utils import fuse_model, get_model_info, postprocess
 from yolox.utils.visualize import plot_tracking
 
 from tracker.mc_bot_sort import BoTSORT
+from tracker.results import RESULTS_EXT, open_results
 from tracker.tracking_utils.timer import Timer
 
 
@@ -60,6 +61,7 @@ def make_parser():
     parser.add_argument("--fast-reid-weights", dest="fast_reid_weights", default=r"pretrained/mot17_sbs_S50.pth", type=str,help="reid config file path")
     parser.add_argument('--proximity_thresh', type=float, default=0.5, help='threshold for rejecting low overlap reid matches')
     parser.add_argument('--appearance_thresh', type=float, default=0.25, help='threshold for rejecting low appearance similarity reid matches')
+    parser.add_argument('--result-format', dest='result_format', default='txt', type=str, help='results format: txt (MOTChallenge) | trk (binary, see tracker/results.py)')
     return parser
 
 
@@ -74,19 +76,6 @@ def get_image_list(path):
     return image_names
 
 
-def write_results(filename, results):
-    save_format = '{frame},{id},{x1},{y1},{w},{h},{s},-1,-1,-1\n'
-    with open(filename, 'w') as f:
-        for frame_id, tlwhs, track_ids, scores in results:
-            for tlwh, track_id, score in zip(tlwhs, track_ids, scores):
-                if track_id < 0:
-                    continue
-                x1, y1, w, h = tlwh
-                line = save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1), w=round(w, 1), h=round(h, 1), s=round(score, 2))
-                f.write(line)
-    logger.info('save results to {}'.format(filename))
-
-
 class Predictor(object):
     def __init__(
         self,
@@ -185,11 +174,7 @@ def image_demo(predictor, vis_folder, current_time, args):
                 online_ids.append(tid)
                 online_scores.append(t.score)
                 online_cls.append(t.cls)
-
-                # save results
-                results.append(
-                    f"{frame_id},{tid},{tlwh[0]:.2f},{tlwh[1]:.2f},{tlwh[2]:.2f},{tlwh[3]:.2f},{t.score:.2f},-1,-1,-1\n"
-                )
+        results.append((frame_id, online_ids, online_tlwhs, online_scores, online_cls))
         timer.toc()
         online_im = plot_tracking(
             img_info['raw_img'], online_tlwhs, online_ids, frame_id=frame_id, fps=1. / timer.average_time, ids2=online_cls
@@ -213,9 +198,10 @@ def image_demo(predictor, vis_folder, current_time, args):
             break
 
     if args.save_result:
-        res_file = osp.join(vis_folder, f"{timestamp}.txt")
-        with open(res_file, 'w') as f:
-            f.writelines(results)
+        res_file = osp.join(vis_folder, timestamp + (RESULTS_EXT if args.result_format == 'trk' else '.txt'))
+        with open_results(res_file) as res:
+            for frame_id, ids, tlwhs, scores, classes in results:
+                res.add(frame_id, ids, tlwhs, scores, classes)
         logger.info(f"save results to {res_file}")
 
 
@@ -260,6 +246,7 @@ def imageflow_demo(predictor, vis_folder, current_time, args):
             online_tlwhs = []
             online_ids = []
             online_scores = []
+            online_cls = []
             for t in online_targets:
                 tlwh = t.tlwh
                 tid = t.track_id
@@ -268,9 +255,8 @@ def imageflow_demo(predictor, vis_folder, current_time, args):
                     online_tlwhs.append(tlwh)
                     online_ids.append(tid)
                     online_scores.append(t.score)
-                    results.append(
-                        f"{frame_id},{tid},{tlwh[0]:.2f},{tlwh[1]:.2f},{tlwh[2]:.2f},{tlwh[3]:.2f},{t.score:.2f},-1,-1,-1\n"
-                    )
+                    online_cls.append(t.cls)
+            results.append((frame_id, online_ids, online_tlwhs, online_scores, online_cls))
             timer.toc()
             online_im = plot_tracking(
                 img_info['raw_img'], online_tlwhs, online_ids, frame_id=frame_id + 1, fps=1. / timer.average_time
@@ -288,9 +274,10 @@ def imageflow_demo(predictor, vis_folder, current_time, args):
         frame_id += 1
 
     if args.save_result:
-        res_file = osp.join(vis_folder, f"{timestamp}.txt")
-        with open(res_file, 'w') as f:
-            f.writelines(results)
+        res_file = osp.join(vis_folder, timestamp + (RESULTS_EXT if args.result_format == 'trk' else '.txt'))
+        with open_results(res_file) as res:
+            for frame_id, ids, tlwhs, scores, classes in results:
+                res.add(frame_id, ids, tlwhs, scores, classes)
         logger.info(f"save results to {res_file}")
 
 
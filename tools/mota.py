@@ -11,13 +11,19 @@ from yolox.evaluators import MOTEvaluator
 
 import argparse
 import os
+import sys
 import random
 import warnings
 import glob
 import motmetrics as mm
+import pandas as pd
 from collections import OrderedDict
 from pathlib import Path
 
+sys.path.append('.')
+
+from tracker.results import RESULTS_EXT, read_results
+
 
 def compare_dataframes(gts, ts):
     accs = []
@@ -33,6 +39,20 @@ def compare_dataframes(gts, ts):
     return accs, names
 
 
+def load_results_dataframe(path, min_confidence=-1.0):
+    """Binary results (tracker/results.py) as motmetrics loads MOTChallenge text (fmt='mot15-2D')."""
+    results = read_results(path)
+    tlwh = results['tlwh']
+    df = pd.DataFrame({
+        'FrameId': results['frame'], 'Id': results['id'],
+        # MOTChallenge boxes are 1-based
+        'X': tlwh[:, 0] - 1., 'Y': tlwh[:, 1] - 1., 'Width': tlwh[:, 2], 'Height': tlwh[:, 3],
+        'Confidence': results['score'], 'ClassId': results['cls'], 'Visibility': -1.,
+    }).astype({'X': float, 'Y': float, 'Width': float, 'Height': float, 'Confidence': float, 'ClassId': float})
+    df = df.set_index(['FrameId', 'Id'])
+    return df[df['Confidence'] >= min_confidence]
+
+
 # evaluate MOTA
 results_folder = 'YOLOX_outputs/yolox_x_ablation/track_results'
 mm.lap.default_solver = 'lap'
@@ -43,7 +63,8 @@ print('gt_type', gt_type)
 gtfiles = glob.glob(
     os.path.join('datasets/mot/train', '*/gt/gt{}.txt'.format(gt_type)))
 print('gt_files', gtfiles)
-tsfiles = [f for f in glob.glob(os.path.join(results_folder, '*.txt')) if not os.path.basename(f).startswith('eval')]
+tsfiles = [f for f in glob.glob(os.path.join(results_folder, '*.txt')) + glob.glob(os.path.join(results_folder, '*' + RESULTS_EXT))
+           if not os.path.basename(f).startswith('eval')]
 
 logger.info('Found {} groundtruths and {} test files.'.format(len(gtfiles), len(tsfiles)))
 logger.info('Available LAP solvers {}'.format(mm.lap.available_solvers))
@@ -51,7 +72,9 @@ logger.info('Default LAP solver \'{}\''.format(mm.lap.default_solver))
 logger.info('Loading files.')
 
 gt = OrderedDict([(Path(f).parts[-3], mm.io.loadtxt(f, fmt='mot15-2D', min_confidence=1)) for f in gtfiles])
-ts = OrderedDict([(os.path.splitext(Path(f).parts[-1])[0], mm.io.loadtxt(f, fmt='mot15-2D', min_confidence=-1.0)) for f in tsfiles])    
+ts = OrderedDict([(os.path.splitext(Path(f).parts[-1])[0],
+                   load_results_dataframe(f) if f.endswith(RESULTS_EXT) else mm.io.loadtxt(f, fmt='mot15-2D', min_confidence=-1.0))
+                  for f in tsfiles])
 
 mh = mm.metrics.create()    
 accs, names = compare_dataframes(gt, ts)
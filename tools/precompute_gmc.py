@@ -0,0 +1,121 @@
+import sys
+import argparse
+import os
+import os.path as osp
+import glob
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from loguru import logger
+
+sys.path.append('.')
+
+from tracker.gmc import GMC, gmc_cache_file
+
+VIDEO_EXT = [".mp4", ".avi", ".mov", ".mkv"]
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("Precompute GMC")
+    parser.add_argument("--path", default="", help="path to a video or a folder of videos")
+    parser.add_argument("--cache", default=r"tracker/GMC_files/cache", type=str, help="directory of the GMC caches")
+    parser.add_argument("--cmc-method", dest="cmc_method", default="sparseOptFlow", type=str, help="cmc method: orb | sift | ecc | sparseOptFlow")
+    parser.add_argument("--downscale", default=2, type=int, help="downscale factor of the frames before estimating the motion")
+    parser.add_argument("--workers", default=os.cpu_count(), type=int, help="number of worker processes")
+    parser.add_argument("--chunk", default=0, type=int, help="frames per shard, 0 to split each video between the workers left per video. "
+                                                            "Every shard also decodes the frames before it, so the decoding grows with the number of shards")
+    parser.add_argument("--overlap", default=10, type=int, help="warm-up frames processed before each shard, and dropped")
+    parser.add_argument("--overwrite", default=False, action="store_true", help="recompute existing caches")
+
+    return parser
+
+
+def get_video_list(path):
+    if osp.isfile(path):
+        return [path]
+    return sorted(f for f in glob.glob(osp.join(path, '*')) if osp.splitext(f)[1].lower() in VIDEO_EXT)
+
+
+def compute_range(video_path, method, downscale, start, stop, overlap):
+    """
+    Estimate the warps of frames [start, stop) of a video (to its end if `stop`
+    is None). Seeking is only approximate for many containers, so the frames
+    before the shard are grabbed from the start of the video, and the warps of
+    the last `overlap` of them are estimated to warm up the methods relying on
+    the previous frame or warp (all of them). Returns the warps of the frames
+    decoded, fewer than requested when the video ends first.
+    """
+    first = max(0, start - 1 - overlap)
+    cap = cv2.VideoCapture(video_path)
+    gmc = GMC(method=method, downscale=downscale)
+    warps = []
+
+    frame_index = 0
+    while stop is None or frame_index < stop:
+        if frame_index < first:
+            ret_val = cap.grab()
+        else:
+            ret_val, frame = cap.read()
+        if not ret_val:
+            break
+        if frame_index >= first:
+            H = gmc.apply(frame)
+            if frame_index >= start:
+                warps.append(H)
+        frame_index += 1
+
+    cap.release()
+    return np.array(warps, dtype=np.float32).reshape(-1, 2, 3)
+
+
+def main(args):
+    if args.cmc_method not in ['orb', 'sift', 'ecc', 'sparseOptFlow']:
+        raise ValueError("Error: CMC method cannot be precomputed:" + args.cmc_method)
+    os.makedirs(args.cache, exist_ok=True)
+
+    videos = []
+    for video_path in get_video_list(args.path):
+        cache_path = gmc_cache_file(args.cache, video_path, args.cmc_method, args.downscale)
+        if osp.exists(cache_path) and not args.overwrite:
+            logger.info(f"{video_path}: cached in {cache_path}")
+            continue
+        videos.append((video_path, cache_path))
+    # Videos are shared between the workers first, then split into shards to keep every worker busy
+    shards_per_video = max(1, -(-args.workers // max(1, len(videos))))
+
+    jobs = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for video_path, cache_path in videos:
+            # The frame count only places the shards, the last one reads to the end of the video
+            cap = cv2.VideoCapture(video_path)
+            num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            chunk = args.chunk if args.chunk > 0 else -(-num_frames // shards_per_video)
+            chunk = max(1, chunk) if num_frames > 0 else 1
+            starts = list(range(0, max(1, num_frames), chunk))
+            futures = [pool.submit(compute_range, video_path, args.cmc_method, args.downscale, start,
+                                   starts[k + 1] if k + 1 < len(starts) else None, args.overlap)
+                       for k, start in enumerate(starts)]
+            jobs.append((video_path, cache_path, num_frames, starts, futures))
+
+        for video_path, cache_path, num_frames, starts, futures in jobs:
+            shards = [f.result() for f in futures]
+            # Shards are contiguous unless the video ended before one of them
+            short = [k for k in range(len(shards) - 1) if starts[k] + len(shards[k]) != starts[k + 1]]
+            warps = np.concatenate(shards[:short[0] + 1] if short else shards)
+            if len(warps) != num_frames:
+                logger.warning(f"{video_path}: {len(warps)} frames decoded, {num_frames} in the header")
+            if len(warps) == 0:
+                logger.warning(f"{video_path}: no frame decoded, skipped")
+                continue
+
+            part_path = cache_path[:-len('.npy')] + '.part.npy'
+            np.save(part_path, warps)
+            os.replace(part_path, cache_path)
+            logger.info(f"{video_path}: {len(warps)} warps saved to {cache_path}")
+
+
+if __name__ == "__main__":
+    args = make_parser().parse_args()
+    main(args)
@@ -0,0 +1,93 @@
+import sys
+import argparse
+import os
+import os.path as osp
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from loguru import logger
+
+sys.path.append('.')
+
+from tracker.checkpoint import load_checkpoint
+from tracker.results import RESULTS_EXT, open_results, read_results
+from tracker.segments import split_segments, stitch_segments
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("Segment tracking")
+    parser.add_argument("--path", default="", help="path to the video")
+    parser.add_argument("--out", default="", type=str, help="the root folder to output results, as in tools/demo.py")
+    parser.add_argument("--segment-length", dest="segment_length", default=9000, type=int, help="frames per segment")
+    parser.add_argument("--overlap", default=150, type=int, help="frames shared by consecutive segments, where the tracks are stitched")
+    parser.add_argument("--workers", default=2, type=int, help="segments tracked at the same time, one process each")
+    parser.add_argument("--result-format", dest="result_format", default="txt", type=str, help="results format, passed to tools/demo.py: txt (MOTChallenge) | trk (binary, see tracker/results.py)")
+    parser.add_argument("--stitch-only", dest="stitch_only", default=False, action="store_true", help="only stitch segments already tracked (e.g. on other nodes)")
+    parser.add_argument("--match-thresh", dest="match_thresh", default=0.5, type=float, help="stitching threshold on the fused distance")
+    parser.add_argument("--proximity-thresh", dest="proximity_thresh", default=0.5, type=float, help="IoU distance above which appearance is ignored")
+    parser.add_argument("--appearance-thresh", dest="appearance_thresh", default=0.25, type=float, help="appearance distance above which appearance is ignored")
+    parser.add_argument("--id-penalty", dest="id_penalty", default=0.1, type=float, help="distance added to the tracks of different player ids")
+    parser.add_argument("--no-player-ids", dest="player_ids", default=True, action="store_false", help="track ids are not player ids: number the stitched tracks anew")
+
+    return parser
+
+
+def segment_paths(args, name, k):
+    """Output folder of segment `k`, and its results and tracklet features as tools/demo.py saves them."""
+    segment_dir = osp.join(args.out, name, 'segments', f'{k:03d}')
+    res_file = osp.join(segment_dir, name, f'{name}_tracking')
+    return segment_dir, res_file + result_ext(args), res_file + '_features.npz'
+
+
+def result_ext(args):
+    return RESULTS_EXT if args.result_format == 'trk' else '.txt'
+
+
+def track_segment(args, demo_args, name, k, start, stop):
+    """Track frames [start, stop) of the video with tools/demo.py, in a process of its own."""
+    segment_dir, res_file, _ = segment_paths(args, name, k)
+    os.makedirs(segment_dir, exist_ok=True)
+    cmd = [sys.executable, 'tools/demo.py', 'video', '--path', args.path, '--out', segment_dir, '--save_result',
+           '--start-frame', str(start), '--end-frame', str(stop), '--tracklet-features', str(args.overlap),
+           '--result-format', args.result_format] + demo_args
+    with open(osp.join(segment_dir, 'demo.log'), 'w') as log:
+        subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, check=True)
+    return res_file
+
+
+def main(args, demo_args):
+    name = osp.basename(args.path)[:-len('.mp4')]
+    cap = cv2.VideoCapture(args.path)
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if num_frames <= 0:
+        raise ValueError("Error: unable to read the frame count of " + args.path)
+
+    ranges = split_segments(num_frames, args.segment_length, args.overlap)
+    logger.info(f"{args.path}: {num_frames} frames in {len(ranges)} segments")
+    if not args.stitch_only:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(track_segment, args, demo_args, name, k, start, stop)
+                       for k, (start, stop) in enumerate(ranges)]
+            for future in futures:
+                logger.info(f"segment tracked: {future.result()}")
+
+    segments = []
+    for k, (start, stop) in enumerate(ranges):
+        _, res_file, features_file = segment_paths(args, name, k)
+        features = load_checkpoint(features_file) if osp.exists(features_file) else None
+        segments.append({'start': start, 'stop': stop, 'rows': read_results(res_file).to_rows(), 'features': features})
+    rows = stitch_segments(segments, args.match_thresh, args.proximity_thresh, args.appearance_thresh,
+                           args.player_ids, args.id_penalty)
+
+    res_file = osp.join(args.out, name, f'{name}_tracking' + result_ext(args))
+    with open_results(res_file) as writer:
+        writer.add_rows(rows)
+    logger.info(f"save results to {res_file}")
+
+
+if __name__ == "__main__":
+    # Other arguments are passed to tools/demo.py
+    args, demo_args = make_parser().parse_known_args()
+    main(args, demo_args)
@@ -2,6 +2,7 @@ import argparse
 import os
 import sys
 import os.path as osp
+from functools import partial
 import cv2
 import numpy as np
 import torch
@@ -10,13 +11,15 @@ sys.path.append('.')
 
 from loguru import logger
 
-from yolox.data.data_augment import preproc
+from yolox.data.data_augment import Letterbox
 from yolox.exp import get_exp
-from yolox.utils import fuse_model, get_model_info, postprocess
+from yolox.utils import fuse_model, get_model_info, TorchBackend, ONNXBackend
 from yolox.utils.visualize import plot_tracking
 
 from tracker.tracking_utils.timer import Timer
 from tracker.bot_sort import BoTSORT
+from tracker.pipeline import Pipeline
+from tracker.results import RESULTS_EXT, open_results
 
 IMAGE_EXT = [".jpg", ".jpeg", ".webp", ".bmp", ".png"]
 
@@ -42,6 +45,10 @@ def make_parser():
     parser.add_argument("--conf", default=None, type=float, help="test conf")
     parser.add_argument("--nms", default=None, type=float, help="test nms threshold")
     parser.add_argument("--tsize", default=None, type=int, help="test img size")
+    parser.add_argument("--backend", default="torch", type=str, help="detector backend: torch | onnx")
+    parser.add_argument("--onnx-model", dest="onnx_model", default=None, type=str, help="YOLOX model exported by tools/export_onnx.py, for --backend onnx")
+    parser.add_argument("--intra-op-threads", dest="intra_op_threads", default=0, type=int, help="onnxruntime intra-op threads (0: default)")
+    parser.add_argument("--inter-op-threads", dest="inter_op_threads", default=0, type=int, help="onnxruntime inter-op threads (0: default)")
     parser.add_argument("--fp16", dest="fp16", default=False, action="store_true", help="Adopting mix precision evaluating.")
     parser.add_argument("--fuse", dest="fuse", default=False, action="store_true", help="Fuse conv and bn for testing.")
 
@@ -55,7 +62,7 @@ def make_parser():
     parser.add_argument('--min_box_area', type=float, default=10, help='filter out tiny boxes')
 
     # CMC
-    parser.add_argument("--cmc-method", default="file", type=str, help="cmc method: files (Vidstab GMC) | orb | ecc |none")
+    parser.add_argument("--cmc-method", default="file", type=str, help="cmc method: files (Vidstab GMC) | orb | ecc | sparseOptFlow | none")
 
     # ReID
     parser.add_argument("--with-reid", dest="with_reid", default=False, action="store_true", help="use Re-ID flag.")
@@ -63,6 +70,13 @@ def make_parser():
     parser.add_argument("--fast-reid-weights", dest="fast_reid_weights", default=r"pretrained/mot17_sbs_S50.pth", type=str, help="reid config file path")
     parser.add_argument('--proximity_thresh', type=float, default=0.5, help='threshold for rejecting low overlap reid matches')
     parser.add_argument('--appearance_thresh', type=float, default=0.25, help='threshold for rejecting low appearance similarity reid matches')
+    parser.add_argument('--feat-history', dest='feat_history', type=int, default=50, help='number of past appearance features kept per track (0 disables the history)')
+    parser.add_argument('--removed-retention', dest='removed_retention', type=int, default=0, help='frames a removed track id is remembered (0: until the bounded archive overwrites it)')
+
+    # Pipeline
+    parser.add_argument('--result-format', dest='result_format', default='txt', type=str, help='results format: txt (MOTChallenge) | trk (binary, see tracker/results.py)')
+    parser.add_argument('--queue-size', dest='queue_size', type=int, default=32, help='frames buffered in front of each pipeline stage')
+    parser.add_argument('--read-workers', dest='read_workers', type=int, default=4, help='threads reading (and saving, with --save-frames) the images')
 
     return parser
 
@@ -78,27 +92,14 @@ def get_image_list(path):
     return image_names
 
 
-def write_results(filename, results):
-    save_format = '{frame},{id},{x1},{y1},{w},{h},{s},-1,-1,-1\n'
-    with open(filename, 'w') as f:
-        for frame_id, tlwhs, track_ids, scores in results:
-            for tlwh, track_id, score in zip(tlwhs, track_ids, scores):
-                if track_id < 0:
-                    continue
-                x1, y1, w, h = tlwh
-                line = save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1), w=round(w, 1),
-                                          h=round(h, 1), s=round(score, 2))
-                f.write(line)
-    logger.info('save results to {}'.format(filename))
-
-
 class Predictor(object):
     def __init__(
             self,
             model,
             exp,
             device=torch.device("cpu"),
-            fp16=False
+            fp16=False,
+            backend=None
     ):
         self.model = model
         self.num_classes = exp.num_classes
@@ -110,6 +111,12 @@ class Predictor(object):
 
         self.rgb_means = (0.485, 0.456, 0.406)
         self.std = (0.229, 0.224, 0.225)
+        self.letterbox = Letterbox(self.test_size, self.rgb_means, self.std)
+
+        # Anything that maps a preprocessed batch to per-image detections, see yolox.utils.backends
+        if backend is None:
+            backend = TorchBackend(self.model, self.num_classes, self.confthre, self.nmsthre, device, fp16)
+        self.backend = backend
 
     def inference(self, img, timer):
         img_info = {"id": 0}
@@ -124,20 +131,80 @@ class Predictor(object):
         img_info["width"] = width
         img_info["raw_img"] = img
 
-        img, ratio = preproc(img, self.test_size, self.rgb_means, self.std)
-        img_info["ratio"] = ratio
-        img = torch.from_numpy(img).unsqueeze(0).float().to(self.device)
-        if self.fp16:
-            img = img.half()  # to FP16
+        img, img_info["ratio"] = self.letterbox(img)
 
-        with torch.no_grad():
-            timer.tic()
-            outputs = self.model(img)
-            outputs = postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
+        timer.tic()
+        outputs = self.backend(img[None])
 
         return outputs, img_info
 
 
+def read_image(item):
+    """Read stage (thread pool): decode an image of the sequence."""
+    frame_id, img_path = item
+    return {'frame_id': frame_id, 'path': img_path, 'frame': cv2.imread(img_path)}
+
+
+def detect_image(item, predictor, tracker, args):
+    """Model stage: detect the objects of a frame and embed the high score detections for ReID."""
+    outputs, img_info = predictor.inference(item['frame'], Timer())
+    scale = min(predictor.test_size[0] / float(img_info['height'], ), predictor.test_size[1] / float(img_info['width']))
+
+    item['detections'] = item['features'] = None
+    if outputs[0] is not None:
+        outputs = outputs[0].cpu().numpy()
+        detections = outputs[:, :7]
+        detections[:, :4] /= scale
+        item['detections'] = detections
+        if args.with_reid:
+            item['features'] = tracker.embed(item['frame'], detections)
+    return item
+
+
+def estimate_motion(item, tracker):
+    """GMC stage: camera motion of a frame, for the tracker. Frames are seen in order, as GMC needs."""
+    item['warp'] = None
+    if item['detections'] is not None:
+        item['warp'] = tracker.estimate_motion(item['frame'], item['detections'])
+    return item
+
+
+def track_image(item, tracker, args):
+    """Tracker stage: associate the detections of a frame, strictly in frame order."""
+    frame_id = item['frame_id']
+    item['tlwhs'], item['ids'], item['scores'] = [], [], []
+    if item['detections'] is not None:
+        trackerTimer.tic()
+        online_targets = tracker.update(item['detections'], None, item['frame'],
+                                        features=item['features'], warp=item['warp'])
+        trackerTimer.toc()
+
+        for t in online_targets:
+            tlwh = t.tlwh
+            tid = t.track_id
+            vertical = tlwh[2] / tlwh[3] > args.aspect_ratio_thresh
+            if tlwh[2] * tlwh[3] > args.min_box_area and not vertical:
+                item['tlwhs'].append(tlwh)
+                item['ids'].append(tid)
+                item['scores'].append(t.score)
+    # Frames leave the tracker at the pipeline throughput
+    timer.toc()
+    timer.tic()
+    item['features'] = None
+    return item
+
+
+def save_image(item, save_folder):
+    """Render stage (thread pool): draw the tracks of a frame and save it."""
+    online_im = item['frame']
+    if item['detections'] is not None:
+        online_im = plot_tracking(
+            online_im, item['tlwhs'], item['ids'], frame_id=item['frame_id'], fps=1. / max(1e-5, timer.average_time)
+        )
+    cv2.imwrite(osp.join(save_folder, osp.basename(item['path'])), online_im)
+    return item
+
+
 def image_track(predictor, vis_folder, args):
     if osp.isdir(args.path):
         files = get_image_list(args.path)
@@ -153,59 +220,28 @@ def image_track(predictor, vis_folder, args):
     # Tracker
     tracker = BoTSORT(args, frame_rate=args.fps)
 
-    results = []
-
-    for frame_id, img_path in enumerate(files, 1):
-
-        # Detect objects
-        outputs, img_info = predictor.inference(img_path, timer)
-        scale = min(exp.test_size[0] / float(img_info['height'], ), exp.test_size[1] / float(img_info['width']))
-
-        if outputs[0] is not None:
-            outputs = outputs[0].cpu().numpy()
-            detections = outputs[:, :7]
-            detections[:, :4] /= scale
-
-            trackerTimer.tic()
-            online_targets = tracker.update(detections, img_info["raw_img"])
-            trackerTimer.toc()
-
-            online_tlwhs = []
-            online_ids = []
-            online_scores = []
-            for t in online_targets:
-                tlwh = t.tlwh
-                tid = t.track_id
-                vertical = tlwh[2] / tlwh[3] > args.aspect_ratio_thresh
-                if tlwh[2] * tlwh[3] > args.min_box_area and not vertical:
-                    online_tlwhs.append(tlwh)
-                    online_ids.append(tid)
-                    online_scores.append(t.score)
-
-                    # save results
-                    results.append(
-                        f"{frame_id},{tid},{tlwh[0]:.2f},{tlwh[1]:.2f},{tlwh[2]:.2f},{tlwh[3]:.2f},{t.score:.2f},-1,-1,-1\n"
-                    )
-            timer.toc()
-            online_im = plot_tracking(
-                img_info['raw_img'], online_tlwhs, online_ids, frame_id=frame_id, fps=1. / timer.average_time
-            )
-        else:
-            timer.toc()
-            online_im = img_info['raw_img']
-
-        if args.save_frames:
-            save_folder = osp.join(vis_folder, args.name)
-            os.makedirs(save_folder, exist_ok=True)
-            cv2.imwrite(osp.join(save_folder, osp.basename(img_path)), online_im)
-
-        if frame_id % 20 == 0:
-            logger.info('Processing frame {}/{} ({:.2f} fps)'.format(frame_id, num_frames, 1. / max(1e-5, timer.average_time)))
-
-    res_file = osp.join(vis_folder, args.name + ".txt")
-
-    with open(res_file, 'w') as f:
-        f.writelines(results)
+    save_folder = osp.join(vis_folder, args.name)
+    if args.save_frames:
+        os.makedirs(save_folder, exist_ok=True)
+
+    # Read, detect, estimate the camera motion, track and save concurrently, through bounded queues
+    timer.tic()
+    pipeline = Pipeline(enumerate(files, 1), queue_size=args.queue_size)
+    pipeline.add('read', read_image, workers=args.read_workers)
+    pipeline.add('detect', partial(detect_image, predictor=predictor, tracker=tracker, args=args))
+    pipeline.add('gmc', partial(estimate_motion, tracker=tracker))
+    pipeline.add('track', partial(track_image, tracker=tracker, args=args))
+    if args.save_frames:
+        pipeline.add('render', partial(save_image, save_folder=save_folder), workers=args.read_workers)
+
+    res_file = osp.join(vis_folder, args.name + (RESULTS_EXT if args.result_format == 'trk' else '.txt'))
+    with open_results(res_file) as res:
+        for item in pipeline:
+            frame_id = item['frame_id']
+            res.add(frame_id, item['ids'], item['tlwhs'], item['scores'])
+            if frame_id % 20 == 0:
+                logger.info('Processing frame {}/{} ({:.2f} fps)'.format(frame_id, num_frames, 1. / max(1e-5, timer.average_time)))
+    logger.info('Pipeline: {}'.format(pipeline.report()))
     logger.info(f"save results to {res_file}")
 
 
@@ -230,29 +266,36 @@ def main(exp, args):
     if args.tsize is not None:
         exp.test_size = (args.tsize, args.tsize)
 
-    model = exp.get_model().to(args.device)
-    logger.info("Model Summary: {}".format(get_model_info(model, exp.test_size)))
-    model.eval()
-
-    if args.ckpt is None:
-        ckpt_file = osp.join(output_dir, "best_ckpt.pth.tar")
+    if args.backend == "onnx":
+        logger.info("Using onnxruntime to inference: {}".format(args.onnx_model))
+        backend = ONNXBackend(args.onnx_model, exp.num_classes, exp.test_conf, exp.nmsthre, exp.test_size,
+                              args.intra_op_threads, args.inter_op_threads)
+        model = None
     else:
-        ckpt_file = args.ckpt
-    logger.info("loading checkpoint")
-    ckpt = torch.load(ckpt_file, map_location="cpu")
+        backend = None
+        model = exp.get_model().to(args.device)
+        logger.info("Model Summary: {}".format(get_model_info(model, exp.test_size)))
+        model.eval()
 
-    # load the model state dict
-    model.load_state_dict(ckpt["model"])
-    logger.info("loaded checkpoint done.")
+        if args.ckpt is None:
+            ckpt_file = osp.join(output_dir, "best_ckpt.pth.tar")
+        else:
+            ckpt_file = args.ckpt
+        logger.info("loading checkpoint")
+        ckpt = torch.load(ckpt_file, map_location="cpu")
+
+        # load the model state dict
+        model.load_state_dict(ckpt["model"])
+        logger.info("loaded checkpoint done.")
 
-    if args.fuse:
-        logger.info("\tFusing model...")
-        model = fuse_model(model)
+        if args.fuse:
+            logger.info("\tFusing model...")
+            model = fuse_model(model)
 
-    if args.fp16:
-        model = model.half()  # to FP16
+        if args.fp16:
+            model = model.half()  # to FP16
 
-    predictor = Predictor(model, exp, args.device, args.fp16)
+    predictor = Predictor(model, exp, args.device, args.fp16, backend)
 
     image_track(predictor, vis_folder, args)
 
@@ -288,6 +331,10 @@ if __name__ == "__main__":
     else:
         raise ValueError("Error: Unsupported split to evaluate:" + args.split_to_eval)
 
+    # GMC caches are precomputed per video (tools/precompute_gmc.py), not per image sequence
+    if args.cmc_method == 'cache':
+        raise ValueError("Error: CMC method cache is only supported by tools/demo.py")
+
     mainTimer = Timer()
     mainTimer.tic()
 
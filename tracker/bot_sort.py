@@ -2,13 +2,13 @@ from typing import List, Tuple
 import cv2
 import matplotlib.pyplot as plt
 import numpy as np
-from collections import deque
 from itertools import zip_longest
 
 from tracker import matching
 from tracker.gmc import GMC
 from tracker.basetrack import BaseTrack, TrackState
 from tracker.kalman_filter import KalmanFilter
+from tracker.track_store import TrackStore, StoreField, FeatureField, TrackArchive
 
 from fast_reid.fast_reid_interfece import FastReIDInterface
 
@@ -16,7 +16,21 @@ from fast_reid.fast_reid_interfece import FastReIDInterface
 class STrack(BaseTrack):
     shared_kalman = KalmanFilter()
 
-    def __init__(self, tlwh, score, gId=None, feat=None, feat_history=50):
+    # Kalman state and per-frame bookkeeping live in the store of the tracker once the track is activated
+    mean = StoreField(on_set='refresh_boxes')
+    covariance = StoreField()
+    state = StoreField(TrackState.New)
+    is_activated = StoreField(False)
+    score = StoreField(0)
+    frame_id = StoreField(0)
+    start_frame = StoreField(0)
+    smooth_feat = FeatureField()
+    _store_fields = ('mean', 'covariance', 'state', 'is_activated', 'score', 'frame_id', 'start_frame', 'smooth_feat')
+
+    _store = None
+    _slot = None
+
+    def __init__(self, tlwh, score, gId=None, feat=None):
 
         # wait activate
         self._tlwh = np.asarray(tlwh, dtype=np.float)
@@ -31,10 +45,9 @@ class STrack(BaseTrack):
 
         self.smooth_feat = None
         self.curr_feat = None
+        self.alpha = 0.9
         if feat is not None:
             self.update_features(feat)
-        self.features = deque([], maxlen=feat_history)
-        self.alpha = 0.9
 
     def update_features(self, feat):
         feat /= np.linalg.norm(feat)
@@ -43,9 +56,25 @@ class STrack(BaseTrack):
             self.smooth_feat = feat
         else:
             self.smooth_feat = self.alpha * self.smooth_feat + (1 - self.alpha) * feat
-        self.features.append(feat)
+        if self._slot is not None:
+            self._store.push_feature(self._slot, feat)
         self.smooth_feat /= np.linalg.norm(self.smooth_feat)
 
+    @property
+    def features(self):
+        """Feature history of the track (oldest first), kept in the ring buffer of its store slot."""
+        if self._slot is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._store.recent_features(self._slot)
+
+    def mean_feature(self, k=None):
+        """Normalised mean of the last `k` features of the track, or None without history."""
+        return None if self._slot is None else self._store.mean_feature(self._slot, k)
+
+    def medoid_feature(self, k=None):
+        """Medoid of the last `k` features of the track, or None without history."""
+        return None if self._slot is None else self._store.medoid_feature(self._slot, k)
+
     def predict(self):
         mean_state = self.mean.copy()
         if self.state != TrackState.Tracked:
@@ -55,41 +84,83 @@ class STrack(BaseTrack):
         self.mean, self.covariance = self.kalman_filter.predict(mean_state, self.covariance)
 
     @staticmethod
-    def multi_predict(stracks):
+    def multi_predict(stracks, store):
         if len(stracks) > 0:
-            multi_mean = np.asarray([st.mean.copy() for st in stracks])
-            multi_covariance = np.asarray([st.covariance for st in stracks])
-            for i, st in enumerate(stracks):
-                if st.state != TrackState.Tracked:
-                    multi_mean[i][6] = 0
-                    multi_mean[i][7] = 0
-            multi_mean, multi_covariance = STrack.shared_kalman.multi_predict(multi_mean, multi_covariance)
-            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
+            slots = STrack.store_slots(stracks)
+
+            multi_mean = store.mean[slots]
+            multi_mean[store.state[slots] != TrackState.Tracked, 6:] = 0
+            store.mean[slots], store.covariance[slots] = STrack.shared_kalman.multi_predict(
+                multi_mean, store.covariance[slots])
+            store.refresh_boxes(slots)
 
     @staticmethod
-    def multi_gmc(stracks, H=np.eye(2, 3)):
-        if len(stracks) > 0:
-            multi_mean = np.asarray([st.mean.copy() for st in stracks])
-            multi_covariance = np.asarray([st.covariance for st in stracks])
+    def multi_gmc(stracks, store, H=np.eye(2, 3)):
+        # An identity warp (no camera motion, or --cmc-method none) leaves the states untouched
+        if len(stracks) > 0 and not np.array_equal(H, np.eye(2, 3)):
+            slots = STrack.store_slots(stracks)
 
             R = H[:2, :2]
             R8x8 = np.kron(np.eye(4, dtype=float), R)
             t = H[:2, 2]
 
-            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                mean = R8x8.dot(mean)
-                mean[:2] += t
-                cov = R8x8.dot(cov).dot(R8x8.transpose())
+            multi_mean = np.dot(store.mean[slots], R8x8.T)
+            multi_mean[:, :2] += t
+            store.mean[slots] = multi_mean
+            store.covariance[slots] = np.matmul(np.matmul(R8x8, store.covariance[slots]), R8x8.T)
+            store.refresh_boxes(slots)
 
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
+    @staticmethod
+    def multi_update(stracks, detections, store):
+        """Correct the Kalman state of every track with its matched detection in one call."""
+        if len(stracks) > 0:
+            slots = STrack.store_slots(stracks)
+
+            tlwhs = np.asarray([det._tlwh for det in detections])
+            measurements = tlwhs.copy()
+            measurements[:, :2] += tlwhs[:, 2:] / 2
+            store.mean[slots], store.covariance[slots] = STrack.shared_kalman.multi_update(
+                store.mean[slots], store.covariance[slots], measurements)
+            store.refresh_boxes(slots)
 
-    def activate(self, kalman_filter, frame_id, player_id: int = None):
-        """Start a new tracklet"""
+    @staticmethod
+    def store_slots(stracks):
+        """Indices of the store rows owned by the given (activated) tracks."""
+        return np.fromiter((st._slot for st in stracks), dtype=np.int64, count=len(stracks))
+
+    def attach(self, store):
+        """Move the track state into a slot of the given store."""
+        if self._slot is not None:
+            return
+        local = {name: self.__dict__.pop(name) for name in self._store_fields if name in self.__dict__}
+        self._store = store
+        self._slot = store.allocate()
+        store.state[self._slot] = TrackState.New
+        store.is_activated[self._slot] = False
+        store.score[self._slot] = 0
+        store.frame_id[self._slot] = 0
+        store.start_frame[self._slot] = 0
+        for name, value in local.items():
+            if value is not None:
+                setattr(self, name, value)
+
+    def detach(self):
+        """Copy the track state out of the store and free its slot, e.g. once the track is removed."""
+        if self._slot is None:
+            return
+        local = {name: getattr(self, name) for name in self._store_fields}
+        for name, value in local.items():
+            if isinstance(value, np.ndarray):
+                local[name] = value.copy()
+        self._store.release(self._slot)
+        self._slot = None
+        self.__dict__.update(local)
+
+    def activate(self, kalman_filter, frame_id, player_id: int = None, store: TrackStore = None):
+        """Start a new tracklet, in a slot of `store` (the tracker's)"""
         self.kalman_filter = kalman_filter
         self.track_id = player_id if player_id is not None else self.next_id()
+        self.attach(store)
 
         self.mean, self.covariance = self.kalman_filter.initiate(self.tlwh_to_xywh(self._tlwh))
 
@@ -100,9 +171,12 @@ class STrack(BaseTrack):
         self.frame_id = frame_id
         self.start_frame = frame_id
 
-    def re_activate(self, new_track: 'STrack', frame_id, new_id=False):
-
-        self.mean, self.covariance = self.kalman_filter.update(self.mean, self.covariance, self.tlwh_to_xywh(new_track.tlwh))
+    def re_activate(self, new_track: 'STrack', frame_id, new_id=False, correct=True, store: TrackStore = None):
+        # A track removed meanwhile gave its slot back, it takes a new one
+        if store is not None:
+            self.attach(store)
+        if correct:
+            self.mean, self.covariance = self.kalman_filter.update(self.mean, self.covariance, self.tlwh_to_xywh(new_track.tlwh))
         if new_track.curr_feat is not None:
             self.update_features(new_track.curr_feat)
             
@@ -115,12 +189,12 @@ class STrack(BaseTrack):
             self.track_id = self.next_id()
         self.score = new_track.score
 
-    def update(self, new_track: 'STrack', frame_id):
+    def update(self, new_track: 'STrack', frame_id, correct=True):
         """
         Update a matched track
         :type new_track: STrack
         :type frame_id: int
-        :type update_feature: bool
+        :type correct: bool, False if the Kalman correction is batched through `STrack.multi_update`
         :return:
         """
         self.frame_id = frame_id
@@ -128,7 +202,8 @@ class STrack(BaseTrack):
 
         self._tlwh = new_track._tlwh
 
-        self.mean, self.covariance = self.kalman_filter.update(self.mean, self.covariance, self.tlwh_to_xywh(self._tlwh))
+        if correct:
+            self.mean, self.covariance = self.kalman_filter.update(self.mean, self.covariance, self.tlwh_to_xywh(self._tlwh))
 
         if new_track.curr_feat is not None:
             self.update_features(new_track.curr_feat)
@@ -154,7 +229,7 @@ class STrack(BaseTrack):
         """Convert bounding box to format `(min x, min y, max x, max y)`, i.e.,
         `(top left, bottom right)`.
         """
-        ret = self.tlwh.copy()
+        ret = self.tlwh
         ret[2:] += ret[:2]
         return ret
 
@@ -163,7 +238,7 @@ class STrack(BaseTrack):
         """Convert bounding box to format `(min x, min y, max x, max y)`, i.e.,
         `(top left, bottom right)`.
         """
-        ret = self.tlwh.copy()
+        ret = self.tlwh
         ret[:2] += ret[2:] / 2.0
         return ret
 
@@ -210,8 +285,9 @@ class BoTSORT(object):
 
         self.tracked_stracks = []  # type: list[STrack]
         self.lost_stracks = []  # type: list[STrack]
-        self.removed_stracks = []  # type: list[STrack]
+        self.removed_stracks = TrackArchive(retention=args.removed_retention)
         BaseTrack.clear_count()
+        self.store = TrackStore(history_depth=args.feat_history)
 
         self.frame_id = 0
         self.args = args
@@ -231,9 +307,142 @@ class BoTSORT(object):
         if args.with_reid:
             self.encoder = FastReIDInterface(args.fast_reid_config, args.fast_reid_weights, args.device)
 
-        self.gmc = GMC(method=args.cmc_method, verbose=[args.name, args.ablation])
+        if args.cmc_method == 'cache':
+            self.gmc = GMC(method=args.cmc_method, verbose=[args.gmc_cache_file])
+        else:
+            self.gmc = GMC(method=args.cmc_method, verbose=[args.name, args.ablation])
+
+    # Store columns of a track, saved by `state_dict`
+    _state_columns = ('mean', 'covariance', 'state', 'is_activated', 'score', 'frame_id', 'start_frame',
+                      'smooth_feat', 'has_smooth_feat', 'history', 'history_count')
+
+    def state_dict(self, gmc=True):
+        """
+        Snapshot of the tracker, to checkpoint and resume a long run (see
+        `tracker.checkpoint`): every live (tracked or lost) track with its Kalman
+        state, features and feature history, the archive of removed tracks, the
+        frame and id counters and, unless `gmc` is False, the GMC state. The
+        state is a nested dict of arrays and scalars, copied from the tracker.
+        """
+        # Tracks are saved once each, and the two pools as indices into them
+        tracks, index = [], {}
+        for track in self.tracked_stracks + self.lost_stracks:
+            if id(track) not in index:
+                index[id(track)] = len(tracks)
+                tracks.append(track)
+
+        store = self.store
+        slots = STrack.store_slots(tracks)
+        curr_feats = [track.curr_feat for track in tracks]
+        feat = next((feat for feat in curr_feats if feat is not None), np.zeros(0, dtype=np.float32))
+
+        state = {
+            'frame_id': self.frame_id,
+            'count': BaseTrack._count,
+            'history_depth': store.history_depth,
+            'tracked': np.array([index[id(track)] for track in self.tracked_stracks], dtype=np.int64),
+            'lost': np.array([index[id(track)] for track in self.lost_stracks], dtype=np.int64),
+            'tracks': {
+                'track_id': np.array([track.track_id for track in tracks], dtype=np.int64),
+                'tlwh': np.array([track._tlwh for track in tracks], dtype=np.float64).reshape(-1, 4),
+                'tracklet_len': np.array([track.tracklet_len for track in tracks], dtype=np.int64),
+                'alpha': np.array([track.alpha for track in tracks], dtype=np.float64),
+                'curr_feat': np.array([f if f is not None else np.zeros_like(feat) for f in curr_feats] or
+                                      np.zeros((0, len(feat))), dtype=feat.dtype),
+                'has_curr_feat': np.array([feat is not None for feat in curr_feats], dtype=bool),
+            },
+            'removed': self.removed_stracks.state_dict(),
+        }
+        for name in self._state_columns:
+            state['tracks'][name] = getattr(store, name)[slots]
+        if gmc:
+            state['gmc'] = self.gmc.state_dict()
+        return state
+
+    def load_state_dict(self, state):
+        """Resume from a snapshot taken by `state_dict`, replacing every track of the tracker."""
+        columns = state['tracks']
+        store = self.store
+        store.clear(history_depth=int(state['history_depth']))
+        if columns['smooth_feat'].shape[1] > 0:
+            store.reserve_features(columns['smooth_feat'].shape[1])
+
+        tracks = []
+        for i in range(len(columns['track_id'])):
+            track = STrack(columns['tlwh'][i], float(columns['score'][i]))
+            track.track_id = int(columns['track_id'][i])
+            track.kalman_filter = self.kalman_filter
+            track.tracklet_len = int(columns['tracklet_len'][i])
+            track.alpha = float(columns['alpha'][i])
+            track.curr_feat = columns['curr_feat'][i].copy() if columns['has_curr_feat'][i] else None
+            track.attach(store)
+            tracks.append(track)
+
+        slots = STrack.store_slots(tracks)
+        for name in self._state_columns:
+            getattr(store, name)[slots] = columns[name]
+        store.refresh_boxes(slots)
+
+        self.tracked_stracks = [tracks[i] for i in state['tracked']]
+        self.lost_stracks = [tracks[i] for i in state['lost']]
+        self.removed_stracks.load_state_dict(state['removed'])
+        self.frame_id = int(state['frame_id'])
+        BaseTrack._count = int(state['count'])
+        if 'gmc' in state:
+            self.gmc.load_state_dict(state['gmc'])
+
+    def high_score_inds(self, output_results):
+        """Rows of `output_results` that `update` keeps as high score detections (to embed and mask in GMC)."""
+        if not len(output_results):
+            return np.zeros((0,), dtype=np.int_)
+        if output_results.shape[1] == 5:
+            scores = output_results[:, 4]
+        else:
+            scores = output_results[:, 4] * output_results[:, 5]
+        return np.flatnonzero((scores > self.track_low_thresh) & (scores > self.args.track_high_thresh))
+
+    def embed(self, img, output_results, crops=None):
+        """ReID embeddings of the high score detections of a frame, as `update` computes them."""
+        keep = self.high_score_inds(output_results)
+        if crops is not None:
+            crops = crops.select(keep)
+        return self.encoder.inference(img, output_results[keep, :4], crops)
+
+    def estimate_motion(self, img, output_results, frame_index=None):
+        """Camera motion of the next frame, as `update` estimates it. Frames must be given in order."""
+        return self.gmc.apply(img, output_results[self.high_score_inds(output_results), :4], frame_index=frame_index)
+
+    def low_confidence_ratio(self):
+        """Fraction of the active tracks that were last matched to a low score detection."""
+        tracks = [track for track in self.tracked_stracks if track.is_activated]
+        if not tracks:
+            return 0.
+        return float(np.mean([track.score < self.track_high_thresh for track in tracks]))
+
+    def propagate(self, img=None, frame_index=None, warp=None):
+        """
+        Advance the tracks to the next frame without detections (keyframe mode,
+        see `tracker.keyframes`): Kalman prediction and camera motion compensation
+        only. Returns the tracks, at their predicted boxes, as `update` would.
+        """
+        self.frame_id += 1
+
+        unconfirmed = [track for track in self.tracked_stracks if not track.is_activated]
+        strack_pool = joint_stracks([track for track in self.tracked_stracks if track.is_activated], self.lost_stracks)
+        STrack.multi_predict(strack_pool, self.store)
+
+        if warp is None:
+            warp = self.gmc.apply(img, None, frame_index=frame_index)
+        STrack.multi_gmc(strack_pool + unconfirmed, self.store, warp)
+
+        return [track for track in self.tracked_stracks]
 
-    def update(self, output_results, gt_ids: List[int], img):
+    def update(self, output_results, gt_ids: List[int], img, frame_index=None, crops=None, features=None, warp=None):
+        """
+        Track the detections of the next frame. The embeddings of the high score
+        detections (`features`) and the camera motion (`warp`) are computed here
+        unless given, e.g. by earlier stages of a pipeline (see `embed` and `estimate_motion`).
+        """
         self.frame_id += 1
         activated_starcks = []
         refind_stracks = []
@@ -261,7 +470,9 @@ class BoTSORT(object):
             dets = bboxes[remain_inds]
             scores_keep = scores[remain_inds]
             classes_keep = classes[remain_inds]
-            gt_ids = gt_ids[remain_inds]
+            gt_ids = gt_ids[remain_inds] if gt_ids is not None else None
+            if crops is not None:
+                crops = crops.select(np.flatnonzero(lowest_inds)[remain_inds])
 
         else:
             bboxes = []
@@ -272,8 +483,13 @@ class BoTSORT(object):
             classes_keep = []
 
         '''Extract embeddings '''
-        features_keep = self.encoder.inference(img, dets) if self.args.with_reid else []
+        if features is not None:
+            features_keep = features
+        else:
+            features_keep = self.encoder.inference(img, dets, crops) if self.args.with_reid else []
+        # Without player ids (e.g. tools/track.py), new tracks get fresh ids as in BoTSORT
         gt_ids = gt_ids if gt_ids is not None else []
+        has_ids = len(gt_ids) > 0
 
         '''Detections'''
         try:
@@ -295,12 +511,12 @@ class BoTSORT(object):
         strack_pool: List[STrack] = joint_stracks(tracked_stracks, self.lost_stracks)
 
         # Predict the current location with KF
-        STrack.multi_predict(strack_pool)
+        STrack.multi_predict(strack_pool, self.store)
 
         # Fix camera motion
-        warp = self.gmc.apply(img, dets)
-        STrack.multi_gmc(strack_pool, warp)
-        STrack.multi_gmc(unconfirmed, warp)
+        if warp is None:
+            warp = self.gmc.apply(img, dets, frame_index=frame_index)
+        STrack.multi_gmc(strack_pool + unconfirmed, self.store, warp)
 
         # Associate with high score detection boxes
         ious_dists = matching.iou_distance(strack_pool, detections)
@@ -310,7 +526,7 @@ class BoTSORT(object):
             ious_dists = matching.fuse_score(ious_dists, detections)
 
         if self.args.with_reid:
-            emb_dists = matching.embedding_distance(strack_pool, detections) / 2.0
+            emb_dists = matching.embedding_distance(strack_pool, detections, mask=ious_dists_mask) / 2.0
             emb_dists[emb_dists > self.appearance_thresh] = 1.0
             emb_dists[ious_dists_mask] = 1.0
             dists = np.minimum(ious_dists, emb_dists)
@@ -351,7 +567,7 @@ class BoTSORT(object):
         ious_dists = matching.real_iou_distance(r_tracked_stracks, detections)
         ious_dists_mask = (ious_dists > 0.3)
         if self.args.with_reid:
-            emb_dists = matching.embedding_distance(r_tracked_stracks, detections) / 2.0
+            emb_dists = matching.embedding_distance(r_tracked_stracks, detections, mask=ious_dists_mask) / 2.0
             emb_dists[emb_dists > self.appearance_thresh] = 1.0
             emb_dists[ious_dists_mask] = 1.0
             dists = np.minimum(ious_dists, emb_dists)
@@ -381,42 +597,54 @@ class BoTSORT(object):
 
         """ Step 4: Init new stracks"""
         """ Replace or Update"""
+        corrected_stracks, corrected_dets = [], []
         for track, det in matches_all:
             # in gt frame, the det should always have track_id
-            if len(gt_ids) == 0 or track.track_id == det.track_id or track.score >= 0.5:
+            if not has_ids or track.track_id == det.track_id or track.score >= 0.5:
                 if not track.is_activated or track.state == TrackState.Tracked:
-                    track.update(det, self.frame_id)
+                    track.update(det, self.frame_id, correct=False)
                     activated_starcks.append(track)
                 else:
-                    track.re_activate(det, self.frame_id, new_id=False)
+                    track.re_activate(det, self.frame_id, new_id=False, correct=False, store=self.store)
                     refind_stracks.append(track)
+                corrected_stracks.append(track)
+                corrected_dets.append(det)
             else:
                 # replace
                 track._tlwh = det._tlwh
-                track.activate(self.kalman_filter, self.frame_id, det.track_id)
+                track.activate(self.kalman_filter, self.frame_id, det.track_id, self.store)
                 track.is_activated = True
                 activated_starcks.append(track)
-                                    
-        # '''can only init new tracks in GT frames'''
-        if len(gt_ids) > 0:
-            for inew in u_detection:
-                track = detections[inew]
-                if track.score < self.new_track_thresh:
+
+        # Kalman correction of all updated and re-activated tracks at once
+        STrack.multi_update(corrected_stracks, corrected_dets, self.store)
+
+        for inew in u_detection:
+            track = detections[inew]
+            if track.score < self.new_track_thresh:
+                if has_ids:
                     print(track.score, 'is too low for new track in frame', self.frame_id)
                     x1, y1, x2, y2 = track.tlbr
                     cropped = img[int(y1):int(y2), int(x1):int(x2)]
                     if cropped.size > 0:
                         cv2.imwrite(f'unclassified/{self.frame_id}-{np.round(track.score, 3)}.png', cropped)
-                    continue
-                # gt_id = None if len(gt_ids) == 0 else gt_ids[inew]
-                # if exist, replace
-                
-                # else, activate
-                
-                track.activate(self.kalman_filter, self.frame_id, gt_ids[inew])
-                # track.activate(self.kalman_filter, self.frame_id, track.track_id)
-                track.is_activated = True
+                continue
+            if not has_ids:
+                # Unconfirmed until matched again, as in BoTSORT
+                track.activate(self.kalman_filter, self.frame_id, store=self.store)
                 activated_starcks.append(track)
+                continue
+            # gt_id = None if len(gt_ids) == 0 else gt_ids[inew]
+            # if exist, replace
+
+            # else, activate
+
+            track.activate(self.kalman_filter, self.frame_id, gt_ids[inew], self.store)
+            # track.activate(self.kalman_filter, self.frame_id, track.track_id)
+            track.is_activated = True
+            activated_starcks.append(track)
+
+        self.removed_stracks.expire(self.frame_id)
 
         """ Step 5: Update state"""
         for track in self.lost_stracks:
@@ -425,15 +653,23 @@ class BoTSORT(object):
                 removed_stracks.append(track)
 
         """ Merge """
+        attached = self.tracked_stracks + self.lost_stracks + activated_starcks
         self.tracked_stracks = [t for t in self.tracked_stracks if t.state == TrackState.Tracked]
         self.tracked_stracks = joint_stracks(self.tracked_stracks, activated_starcks)
         self.tracked_stracks = joint_stracks(self.tracked_stracks, refind_stracks)
         self.lost_stracks = sub_stracks(self.lost_stracks, self.tracked_stracks)
         self.lost_stracks.extend(lost_stracks)
-        self.lost_stracks = sub_stracks(self.lost_stracks, self.removed_stracks)
-        self.removed_stracks.extend(removed_stracks)
+        self.lost_stracks = sub_track_ids(self.lost_stracks, self.removed_stracks)
+        for track in removed_stracks:
+            self.removed_stracks.add(track, self.frame_id)
         self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(self.tracked_stracks, self.lost_stracks)
 
+        # Free the store slots of tracks that left both the tracked and the lost pools
+        alive = {id(t) for t in self.tracked_stracks} | {id(t) for t in self.lost_stracks}
+        for track in attached:
+            if id(track) not in alive:
+                track.detach()
+
         # output_stracks = [track for track in self.tracked_stracks if track.is_activated]
         output_stracks = [track for track in self.tracked_stracks]
         return output_stracks
@@ -463,6 +699,14 @@ def sub_stracks(tlista, tlistb):
     return list(stracks.values())
 
 
+def sub_track_ids(tlista, track_ids):
+    """Like `sub_stracks`, with the tracks to subtract given as a container of ids."""
+    stracks = {}
+    for t in tlista:
+        stracks[t.track_id] = t
+    return [t for tid, t in stracks.items() if tid not in track_ids]
+
+
 def remove_duplicate_stracks(stracksa, stracksb):
     pdist = matching.iou_distance(stracksa, stracksb)
     pairs = np.where(pdist < 0.15)
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+
+def flatten_state(state, prefix=''):
+    """Flatten a nested dict of arrays and scalars into a dict of arrays keyed by '/' separated paths. None values are dropped."""
+    arrays = {}
+    for key, value in state.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            arrays.update(flatten_state(value, name + '/'))
+        elif value is not None:
+            arrays[name] = np.asarray(value)
+    return arrays
+
+
+def unflatten_state(arrays):
+    """Inverse of `flatten_state`. 0-d arrays are returned as python scalars."""
+    state = {}
+    for name, value in arrays.items():
+        node = state
+        keys = name.split('/')
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+        node[keys[-1]] = value.item() if value.ndim == 0 else value
+    return state
+
+
+def save_checkpoint(path, state):
+    """
+    Save a state dict (e.g. `BoTSORT.state_dict()`) to a compressed .npz file.
+    The file is written next to `path` first and then moved in place, so an
+    interrupted save never leaves a truncated checkpoint behind.
+    """
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **flatten_state(state))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """Load a state dict saved by `save_checkpoint`."""
+    with np.load(path, allow_pickle=False) as arrays:
+        return unflatten_state({name: arrays[name] for name in arrays.files})
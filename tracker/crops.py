@@ -0,0 +1,67 @@
+import copy
+
+import numpy as np
+import torch
+from torchvision.ops import roi_align
+
+
+class FrameCrops(object):
+    """
+    Crops of the detection boxes of one frame, shared by every consumer (player
+    classifier, ReID, ...) of that frame.
+
+    The frame is moved to the device once. Boxes are clipped once, and each
+    requested resolution is produced for all boxes by a single `roi_align`, then
+    cached. `roi_align` with one sample per bin is the bilinear resampling that
+    `cv2.resize(..., interpolation=cv2.INTER_LINEAR)` applies to a sliced patch;
+    an adaptive sampling ratio (-1) averages the pixels of each bin, close to
+    the antialiased resize of PIL.
+    """
+
+    def __init__(self, frame, boxes, device=torch.device("cpu")):
+        self.device = torch.device(device)
+        height, width = frame.shape[:2]
+
+        # Integer boxes clipped to the frame, like the slices they replace
+        tlbr = np.asarray(boxes, dtype=np.float64)[:, :4].reshape(-1, 4).astype(np.int_)
+        tlbr[:, 0::2] = np.clip(tlbr[:, 0::2], 0, width)
+        tlbr[:, 1::2] = np.clip(tlbr[:, 1::2], 0, height)
+        self.tlbr = tlbr
+
+        # Crops of patches with no area are still produced, but flagged
+        self.valid = (tlbr[:, 2] > tlbr[:, 0]) & (tlbr[:, 3] > tlbr[:, 1] + 1)
+
+        # 1x3xHxW, BGR as decoded
+        self.frame = torch.from_numpy(np.ascontiguousarray(frame)).to(self.device).permute(2, 0, 1)[None].float()
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.tlbr)
+
+    def resized(self, size, sampling_ratio=1):
+        """
+        All crops resized to `size` (height, width), as an Nx3xHxW float32 RGB
+        tensor (0-255) on the device, with `sampling_ratio` samples per output
+        pixel along each axis (-1: as many as the crop pixels it covers).
+        """
+        size = (int(size[0]), int(size[1]))
+        key = (size, int(sampling_ratio))
+        if key not in self._cache:
+            if len(self) == 0:
+                crops = self.frame.new_zeros((0, 3) + size)
+            else:
+                rois = torch.from_numpy(self.tlbr.astype(np.float32)).to(self.device)
+                crops = roi_align(self.frame, [rois], output_size=size, spatial_scale=1.0,
+                                  sampling_ratio=int(sampling_ratio), aligned=True)
+            self._cache[key] = crops.flip(1)
+        return self._cache[key]
+
+    def select(self, inds):
+        """The crops of a subset of the boxes (integer indices or boolean mask), sharing the frame and cache."""
+        inds = np.flatnonzero(inds) if np.asarray(inds).dtype == bool else np.asarray(inds, dtype=np.int_)
+        subset = copy.copy(self)
+        subset.tlbr = self.tlbr[inds]
+        subset.valid = self.valid[inds]
+        index = torch.from_numpy(inds).to(self.device)
+        subset._cache = {key: crops[index] for key, crops in self._cache.items()}
+        return subset
@@ -1,9 +1,30 @@
 import cv2
+import hashlib
+import os.path as osp
 import matplotlib.pyplot as plt
 import numpy as np
 import copy
 
 
+def video_hash(path, blocks=16, block_size=1 << 20):
+    """
+    Key of the GMC cache of a video: SHA-1 of its size and of `blocks` blocks
+    at fixed offsets, so that long videos are not read in full at every start.
+    """
+    size = osp.getsize(path)
+    sha = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        for k in range(blocks):
+            f.seek(max(0, size - block_size) * k // max(1, blocks - 1))
+            sha.update(f.read(block_size))
+    return sha.hexdigest()
+
+
+def gmc_cache_file(cache_dir, video_path, method, downscale):
+    """Path of the GMC cache of a video computed with `method` and `downscale`, see tools/precompute_gmc.py."""
+    return osp.join(cache_dir, '{}.{}.d{}.npy'.format(video_hash(video_path), method, int(downscale)))
+
+
 class GMC:
     def __init__(self, method='orb', downscale=2, verbose=None):
         super(GMC, self).__init__()
@@ -21,9 +42,18 @@ class GMC:
             self.extractor = cv2.SIFT_create(nOctaveLayers=3, contrastThreshold=0.02, edgeThreshold=20)
             self.matcher = cv2.BFMatcher(cv2.NORM_L2)
 
+        elif self.method == 'sparseOptFlow':
+            self.feature_params = dict(maxCorners=1000, qualityLevel=0.01, minDistance=1, blockSize=3,
+                                       useHarrisDetector=False, k=0.04)
+            self.lk_params = dict(winSize=(15, 15), maxLevel=2,
+                                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+
         elif self.method == 'ecc':
-            number_of_iterations = 5000
-            termination_eps = 1e-6
+            # Coarse-to-fine: a few iterations per pyramid level, warm-started from the previous warp
+            number_of_iterations = 10
+            termination_eps = 1e-4
+            self.pyramid_levels = 4
+            self.finest_level = 1
             self.warp_mode = cv2.MOTION_EUCLIDEAN
             self.criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, number_of_iterations, termination_eps)
 
@@ -46,6 +76,14 @@ class GMC:
 
             if self.gmcFile is None:
                 raise ValueError("Error: Unable to open GMC file in directory:" + filePath)
+        elif self.method == 'cache':
+            # Nx2x3 float32 array, row i holds the warp from frame i-1 to frame i
+            cachePath = verbose[0]
+            if not osp.exists(cachePath):
+                raise ValueError("Error: GMC cache not found, run tools/precompute_gmc.py first:" + cachePath)
+            self.gmcCache = np.load(cachePath, mmap_mode='r')
+            self.cacheIndex = -1
+
         elif self.method == 'none' or self.method == 'None':
             self.method = 'none'
         else:
@@ -54,51 +92,137 @@ class GMC:
         self.prevFrame = None
         self.prevKeyPoints = None
         self.prevDescriptors = None
+        self.prevWarp = None
+        self.prevPyramid = None
 
         self.initializedFirstFrame = False
 
-    def apply(self, raw_frame, detections=None):
+    def apply(self, raw_frame, detections=None, frame_index=None):
         if self.method == 'orb' or self.method == 'sift':
             return self.applyFeaures(raw_frame, detections)
+        elif self.method == 'sparseOptFlow':
+            return self.applySparseOptFlow(raw_frame, detections)
         elif self.method == 'ecc':
             return self.applyEcc(raw_frame, detections)
         elif self.method == 'file':
             return self.applyFile(raw_frame, detections)
+        elif self.method == 'cache':
+            return self.applyCache(frame_index)
         elif self.method == 'none':
             return np.eye(2, 3)
         else:
             return np.eye(2, 3)
 
+    def state_dict(self):
+        """Reference frame, keypoints, descriptors and warp of the previous frame (or position in the file / cache)."""
+        state = {'method': self.method, 'initializedFirstFrame': self.initializedFirstFrame}
+        if self.prevFrame is not None:
+            state['prevFrame'] = self.prevFrame.copy()
+        if self.prevWarp is not None:
+            state['prevWarp'] = np.array(self.prevWarp)
+        if self.prevDescriptors is not None:
+            state['prevDescriptors'] = self.prevDescriptors.copy()
+        if self.prevPyramid is not None:
+            state['prevPyramid'] = {str(level): image.copy() for level, image in enumerate(self.prevPyramid)}
+        if isinstance(self.prevKeyPoints, np.ndarray):
+            state['prevKeyPoints'] = self.prevKeyPoints.copy()
+        elif self.prevKeyPoints is not None:
+            # cv2.KeyPoint tuples, one row per keypoint
+            state['prevCvKeyPoints'] = np.array(
+                [kp.pt + (kp.size, kp.angle, kp.response, kp.octave, kp.class_id) for kp in self.prevKeyPoints],
+                dtype=np.float64).reshape(-1, 7)
+        if self.method == 'cache':
+            state['cacheIndex'] = self.cacheIndex
+        elif self.method == 'file':
+            state['filePosition'] = self.gmcFile.tell()
+        return state
+
+    def load_state_dict(self, state):
+        """Restore the state saved by `state_dict`, on a GMC of the same method."""
+        if state['method'] != self.method:
+            raise ValueError("Error: GMC state of method {} loaded with method {}".format(state['method'], self.method))
+        self.initializedFirstFrame = bool(state['initializedFirstFrame'])
+        self.prevFrame = state.get('prevFrame')
+        self.prevWarp = state.get('prevWarp')
+        self.prevDescriptors = state.get('prevDescriptors')
+        self.prevPyramid = None
+        if 'prevPyramid' in state:
+            self.prevPyramid = [state['prevPyramid'][str(level)] for level in range(len(state['prevPyramid']))]
+        self.prevKeyPoints = state.get('prevKeyPoints')
+        if 'prevCvKeyPoints' in state:
+            self.prevKeyPoints = tuple(cv2.KeyPoint(x, y, size, angle, response, int(octave), int(class_id))
+                                       for x, y, size, angle, response, octave, class_id in state['prevCvKeyPoints'])
+        if self.method == 'cache':
+            self.cacheIndex = int(state['cacheIndex'])
+        elif self.method == 'file':
+            self.gmcFile.seek(int(state['filePosition']))
+
     def applyEcc(self, raw_frame, detections=None):
 
         # Initialize
         height, width, _ = raw_frame.shape
         frame = cv2.cvtColor(raw_frame, cv2.COLOR_BGR2GRAY)
-        H = np.eye(2, 3, dtype=np.float32)
+        H = np.eye(2, 3)
 
-        # Downscale image (TODO: consider using pyramids)
+        # Downscale image
         if self.downscale > 1.0:
             frame = cv2.GaussianBlur(frame, (3, 3), 1.5)
             frame = cv2.resize(frame, (width // self.downscale, height // self.downscale))
             width = width // self.downscale
             height = height // self.downscale
 
+        # Build the image pyramid, finest level first
+        pyramid = [frame]
+        for _ in range(1, self.pyramid_levels):
+            if min(pyramid[-1].shape) < 64:
+                break
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+
         # Handle first frame
-        if not self.initializedFirstFrame:
+        if not self.initializedFirstFrame or len(self.prevPyramid) != len(pyramid):
             # Initialize data
             self.prevFrame = frame.copy()
+            self.prevPyramid = pyramid
+            self.prevWarp = None
 
             # Initialization done
             self.initializedFirstFrame = True
 
             return H
 
-        # Run the ECC algorithm. The results are stored in warp_matrix.
-        # (cc, H) = cv2.findTransformECC(self.prevFrame, frame, H, self.warp_mode, self.criteria)
-        try:
-            (cc, H) = cv2.findTransformECC(self.prevFrame, frame, H, self.warp_mode, self.criteria, None, 1)
-        except:
+        # Warm start from the previous frame-to-frame warp, brought down to the coarsest level
+        warp = np.eye(2, 3, dtype=np.float32) if self.prevWarp is None else self.prevWarp.copy()
+        warp[:, 2] /= 2 ** (len(pyramid) - 1)
+
+        # Run the ECC algorithm from the coarsest to the finest level, doubling the translation in between
+        finest_level = min(self.finest_level, len(pyramid) - 1)
+        found = False
+        for level in range(len(pyramid) - 1, finest_level - 1, -1):
+            if level < len(pyramid) - 1:
+                warp[:, 2] *= 2
+            try:
+                (cc, warp) = cv2.findTransformECC(self.prevPyramid[level], pyramid[level], warp,
+                                                  self.warp_mode, self.criteria, None, 1)
+                found = True
+            except cv2.error:
+                pass
+
+        if found:
+            warp[:, 2] *= 2 ** finest_level
+            self.prevWarp = warp
+            H = warp.astype(np.float64)
+
+            # Handle downscale
+            if self.downscale > 1.0:
+                H[0, 2] *= self.downscale
+                H[1, 2] *= self.downscale
+        else:
             print('Warning: find transform failed. Set warp as identity')
+            self.prevWarp = None
+
+        # Store to next iteration
+        self.prevFrame = frame.copy()
+        self.prevPyramid = pyramid
 
         return H
 
@@ -219,6 +343,85 @@ class GMC:
 
         return H
 
+    def applySparseOptFlow(self, raw_frame, detections=None):
+
+        # Initialize
+        height, width, _ = raw_frame.shape
+        frame = cv2.cvtColor(raw_frame, cv2.COLOR_BGR2GRAY)
+        H = np.eye(2, 3)
+
+        # Downscale image
+        if self.downscale > 1.0:
+            frame = cv2.resize(frame, (width // self.downscale, height // self.downscale))
+            width = width // self.downscale
+            height = height // self.downscale
+
+        # find the keypoints, away from the borders and the detected (moving) objects
+        mask = np.zeros_like(frame)
+        mask[int(0.02 * height): int(0.98 * height), int(0.02 * width): int(0.98 * width)] = 255
+        if detections is not None:
+            for det in detections:
+                tlbr = (det[:4] / self.downscale).astype(np.int_)
+                mask[max(0, tlbr[1]):tlbr[3], max(0, tlbr[0]):tlbr[2]] = 0
+
+        keypoints = cv2.goodFeaturesToTrack(frame, mask=mask, **self.feature_params)
+
+        # Handle first frame
+        if not self.initializedFirstFrame or self.prevKeyPoints is None:
+            # Initialize data
+            self.prevFrame = frame
+            self.prevKeyPoints = keypoints
+            self.prevWarp = np.eye(2, 3)
+
+            # Initialization done
+            self.initializedFirstFrame = True
+
+            return H
+
+        # find correspondences, starting the search where the previous camera motion would move each point
+        initialKeypoints = cv2.transform(self.prevKeyPoints, self.prevWarp.astype(np.float32))
+        matchedKeypoints, status, err = cv2.calcOpticalFlowPyrLK(self.prevFrame, frame, self.prevKeyPoints,
+                                                                 initialKeypoints, flags=cv2.OPTFLOW_USE_INITIAL_FLOW,
+                                                                 **self.lk_params)
+
+        # leave good correspondences only
+        valid = status.reshape(-1).astype(bool)
+        prevPoints = self.prevKeyPoints.reshape(-1, 2)[valid]
+        currPoints = matchedKeypoints.reshape(-1, 2)[valid]
+
+        # Filter matches by spatial distance, then reject outliers of the displacement distribution
+        spatialDistances = currPoints - prevPoints
+        maxSpatialDistance = 0.25 * np.array([width, height])
+        close = np.all(np.abs(spatialDistances) < maxSpatialDistance, axis=1)
+        prevPoints, currPoints, spatialDistances = prevPoints[close], currPoints[close], spatialDistances[close]
+
+        if len(spatialDistances):
+            meanSpatialDistances = np.mean(spatialDistances, 0)
+            stdSpatialDistances = np.std(spatialDistances, 0)
+            inliers = np.all(np.abs(spatialDistances - meanSpatialDistances) <= 2.5 * stdSpatialDistances, axis=1)
+            prevPoints, currPoints = prevPoints[inliers], currPoints[inliers]
+
+        # Find rigid matrix
+        if np.size(prevPoints, 0) > 4:
+            H, inliesrs = cv2.estimateAffinePartial2D(prevPoints, currPoints, cv2.RANSAC)
+            if H is None:
+                H = np.eye(2, 3)
+            self.prevWarp = H.copy()
+
+            # Handle downscale
+            if self.downscale > 1.0:
+                H[0, 2] *= self.downscale
+                H[1, 2] *= self.downscale
+        else:
+            print('Warning: not enough matching points')
+            self.prevWarp = np.eye(2, 3)
+
+        # Store to next iteration
+        self.prevFrame = frame
+        self.prevKeyPoints = keypoints
+
+        return H
+
     def applyFile(self, raw_frame, detections=None):
         line = self.gmcFile.readline()
         tokens = line.split("\t")
@@ -230,4 +433,21 @@ class GMC:
         H[1, 1] = float(tokens[5])
         H[1, 2] = float(tokens[6])
 
-        return H
\ No newline at end of file
+        return H
+
+    def applyCache(self, frame_index=None):
+        # Without an index, frames are assumed to be consecutive
+        if frame_index is None:
+            frame_index = self.cacheIndex + 1
+        # A cache shorter than the video is stale or truncated: do not silently turn the compensation off
+        if frame_index >= len(self.gmcCache):
+            raise ValueError("Error: frame {} is past the end of the GMC cache ({} frames), recompute it with "
+                             "tools/precompute_gmc.py".format(frame_index, len(self.gmcCache)))
+
+        # Chain the warps of the frames skipped since the last call
+        H = np.eye(3)
+        for i in range(self.cacheIndex + 1, frame_index + 1):
+            H[:2] = self.gmcCache[i] @ H
+        self.cacheIndex = max(self.cacheIndex, frame_index)
+
+        return H[:2]
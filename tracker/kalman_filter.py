@@ -224,6 +224,46 @@ class KalmanFilter(object):
             kalman_gain, projected_cov, kalman_gain.T))
         return new_mean, new_covariance
 
+    def multi_update(self, mean, covariance, measurement):
+        """Run Kalman filter correction step (Vectorized version).
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the predicted states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrics of the states.
+        measurement : ndarray
+            The Nx4 dimensional matrix of measurements (x, y, w, h), where
+            (x, y) is the center position, w the width, and h the height of the
+            bounding box. Row i corrects state i.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the measurement-corrected state distributions.
+
+        """
+        std = self._std_weight_position * mean[:, [2, 3, 2, 3]]
+        innovation_cov = np.zeros((len(mean), 4, 4))
+        innovation_cov[:, np.arange(4), np.arange(4)] = np.square(std)
+
+        # The observation model picks the first 4 state entries, so the
+        # projections reduce to slicing instead of products with _update_mat.
+        projected_mean = mean[:, :4]
+        projected_cov = covariance[:, :4, :4] + innovation_cov
+        cross_cov = covariance[:, :4, :]
+
+        # Solve S K^T = H P for all tracks at once, with S the Nx4x4 projected
+        # covariances (symmetric positive definite) and P the state covariances.
+        kalman_gain_t = np.linalg.solve(projected_cov, cross_cov)
+        innovation = measurement - projected_mean
+
+        new_mean = mean + np.einsum('ni,nij->nj', innovation, kalman_gain_t)
+        new_covariance = covariance - np.matmul(
+            kalman_gain_t.transpose((0, 2, 1)), np.matmul(projected_cov, kalman_gain_t))
+        return new_mean, new_covariance
+
     def gating_distance(self, mean, covariance, measurements,
                         only_position=False, metric='maha'):
         """Compute gating distance between state distribution and measurements.
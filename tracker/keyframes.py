@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class KeyframeScheduler(object):
+    """
+    Picks the keyframes of keyframe mode: the detector, the classifiers and the
+    ReID encoder only run on keyframes, and the tracks are propagated by
+    `BoTSORT.propagate` (Kalman prediction and GMC) on the frames in between.
+
+    A frame is a keyframe when `interval` frames passed since the last one, when
+    the camera moved by more than `max_motion` pixels since the previous frame
+    (largest displacement of a frame corner under the GMC warp), or when more
+    than `low_conf_ratio` of the active tracks have a low confidence (see
+    `BoTSORT.low_confidence_ratio`). 0 disables the last two triggers.
+
+    The scheduler never reads the tracker, which may run on another thread: the
+    tracker side publishes its ratio after each frame in `tracked_low_conf`, and
+    the trigger reacts to the latest frame tracked.
+    """
+
+    def __init__(self, interval=1, max_motion=0., low_conf_ratio=0.):
+        self.interval = max(1, int(interval))
+        self.max_motion = max_motion
+        self.low_conf_ratio = low_conf_ratio
+        self.last = None  # index of the last keyframe
+        self.tracked_low_conf = 0.  # low confidence ratio of the tracks, after the last frame tracked
+
+    @property
+    def enabled(self):
+        return self.interval > 1
+
+    @staticmethod
+    def motion(warp, shape):
+        """Largest displacement, in pixels, of the corners of a frame of `shape` under a 2x3 warp."""
+        height, width = shape[:2]
+        corners = np.array([[0, 0], [width, 0], [0, height], [width, height]], dtype=np.float64)
+        warped = np.dot(corners, warp[:, :2].T) + warp[:, 2]
+        return np.linalg.norm(warped - corners, axis=1).max()
+
+    def __call__(self, frame_index, warp=None, shape=None):
+        """Whether frame `frame_index` (called in increasing order) is a keyframe."""
+        keyframe = self.last is None or frame_index - self.last >= self.interval
+        if not keyframe and self.max_motion > 0 and warp is not None:
+            keyframe = self.motion(warp, shape) > self.max_motion
+        if not keyframe and self.low_conf_ratio > 0:
+            keyframe = self.tracked_low_conf > self.low_conf_ratio
+        if keyframe:
+            self.last = frame_index
+        return keyframe
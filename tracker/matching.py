@@ -1,9 +1,9 @@
 import numpy as np
 import scipy
 import lap
+from scipy.sparse.csgraph import connected_components
 from scipy.spatial.distance import cdist
 
-from cython_bbox import bbox_overlaps as bbox_ious
 from tracker import kalman_filter
 
 
@@ -36,16 +36,48 @@ def _indices_to_matches(cost_matrix, indices, thresh):
 
 
 def linear_assignment(cost_matrix, thresh):
+    """
+    Solve the assignment of rows to columns with costs up to `thresh`.
+
+    Pairs above the threshold can never be matched, so the bipartite graph of
+    feasible pairs is split into connected components that are solved
+    independently: components made of a single pair are matched directly and
+    only larger ones are handed to LAPJV.
+    """
     if cost_matrix.size == 0:
         return np.empty((0, 2), dtype=int), tuple(range(cost_matrix.shape[0])), tuple(range(cost_matrix.shape[1]))
-    matches, unmatched_a, unmatched_b = [], [], []
-    cost, x, y = lap.lapjv(cost_matrix, extend_cost=True, cost_limit=thresh)
-    for ix, mx in enumerate(x):
-        if mx >= 0:
-            matches.append([ix, mx])
-    unmatched_a = np.where(x < 0)[0]
-    unmatched_b = np.where(y < 0)[0]
-    matches = np.asarray(matches)
+    n_rows, n_cols = cost_matrix.shape
+    x = np.full(n_rows, -1, dtype=int)
+    y = np.full(n_cols, -1, dtype=int)
+
+    rows, cols = np.nonzero(cost_matrix <= thresh)
+    if len(rows):
+        # Rows are graph nodes [0, n_rows), columns are nodes [n_rows, n_rows + n_cols)
+        graph = scipy.sparse.coo_matrix((np.ones(len(rows), dtype=bool), (rows, cols + n_rows)),
+                                        shape=(n_rows + n_cols, n_rows + n_cols))
+        n_labels, labels = connected_components(graph, directed=False)
+        row_labels, col_labels = labels[:n_rows], labels[n_rows:]
+        row_count = np.bincount(row_labels, minlength=n_labels)
+        col_count = np.bincount(col_labels, minlength=n_labels)
+
+        # A 1x1 component holds exactly one feasible pair
+        single = (row_count == 1) & (col_count == 1)
+        pairs = single[row_labels[rows]] & (cost_matrix[rows, cols] < thresh)
+        x[rows[pairs]] = cols[pairs]
+        y[cols[pairs]] = rows[pairs]
+
+        for label in np.flatnonzero((row_count > 0) & (col_count > 0) & ~single):
+            r = np.flatnonzero(row_labels == label)
+            c = np.flatnonzero(col_labels == label)
+            _, sub_x, _ = lap.lapjv(cost_matrix[np.ix_(r, c)], extend_cost=True, cost_limit=thresh)
+            matched = sub_x >= 0
+            x[r[matched]] = c[sub_x[matched]]
+            y[c[sub_x[matched]]] = r[matched]
+
+    matched_a = np.flatnonzero(x >= 0)
+    matches = np.stack((matched_a, x[matched_a]), axis=1)
+    unmatched_a = np.flatnonzero(x < 0)
+    unmatched_b = np.flatnonzero(y < 0)
     return matches, unmatched_a, unmatched_b
 
 
@@ -57,18 +89,64 @@ def ious(atlbrs, btlbrs):
 
     :rtype ious np.ndarray
     """
-    ious = np.zeros((len(atlbrs), len(btlbrs)), dtype=np.float)
+    atlbrs = np.ascontiguousarray(atlbrs, dtype=np.float32).reshape(-1, 4)
+    btlbrs = np.ascontiguousarray(btlbrs, dtype=np.float32).reshape(-1, 4)
+    ious = np.zeros((len(atlbrs), len(btlbrs)), dtype=np.float32)
     if ious.size == 0:
         return ious
 
-    ious = bbox_ious(
-        np.ascontiguousarray(atlbrs, dtype=np.float),
-        np.ascontiguousarray(btlbrs, dtype=np.float)
-    )
+    # Pixel-inclusive box extents (+1), as in the former cython_bbox.bbox_overlaps
+    areas_a = (atlbrs[:, 2] - atlbrs[:, 0] + 1) * (atlbrs[:, 3] - atlbrs[:, 1] + 1)
+    areas_b = (btlbrs[:, 2] - btlbrs[:, 0] + 1) * (btlbrs[:, 3] - btlbrs[:, 1] + 1)
+
+    iw = np.minimum(atlbrs[:, None, 2], btlbrs[None, :, 2])
+    iw -= np.maximum(atlbrs[:, None, 0], btlbrs[None, :, 0])
+    iw += 1
+    np.maximum(iw, 0, out=iw)
+
+    ih = np.minimum(atlbrs[:, None, 3], btlbrs[None, :, 3])
+    ih -= np.maximum(atlbrs[:, None, 1], btlbrs[None, :, 1])
+    ih += 1
+    np.maximum(ih, 0, out=ih)
+
+    # iw becomes the intersection and ih the union
+    iw *= ih
+    np.add(areas_a[:, None], areas_b[None, :], out=ih)
+    ih -= iw
+    np.divide(iw, ih, out=ious)
 
     return ious
 
 
+def track_tlbrs(tracks):
+    """
+    Current boxes of the tracks as a contiguous Nx4 float32 array. Tracks that
+    own a slot of the same track store are read from its cached boxes, which are
+    refreshed whenever the Kalman state changes.
+    :type tracks: list[STrack] | list[np.ndarray] | np.ndarray
+
+    :rtype tlbrs np.ndarray
+    """
+    if len(tracks) == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+    if isinstance(tracks[0], np.ndarray):
+        return np.ascontiguousarray(tracks, dtype=np.float32).reshape(-1, 4)
+
+    store, slots = _store_slots(tracks)
+    if store is not None:
+        return store.tlbr[slots]
+    return np.asarray([track.tlbr for track in tracks], dtype=np.float32)
+
+
+def _store_slots(tracks):
+    """The track store and slot indices shared by all tracks, or (None, None)."""
+    store = getattr(tracks[0], '_store', None)
+    slots = [getattr(track, '_slot', None) for track in tracks]
+    if store is None or None in slots or any(track._store is not store for track in tracks):
+        return None, None
+    return store, slots
+
+
 def tlbr_expand(tlbr, scale=1.2):
     w = tlbr[2] - tlbr[0]
     h = tlbr[3] - tlbr[1]
@@ -92,14 +170,8 @@ def iou_distance(atracks, btracks):
     :rtype cost_matrix np.ndarray
     """
 
-    if (len(atracks)>0 and isinstance(atracks[0], np.ndarray)) or (len(btracks) > 0 and isinstance(btracks[0], np.ndarray)):
-        atlbrs = atracks
-        btlbrs = btracks
-    else:
-        atlbrs = [track.tlbr for track in atracks]
-        btlbrs = [track.tlbr for track in btracks]
-    _ious = ious(atlbrs, btlbrs)
-    cost_matrix = 1 - _ious
+    cost_matrix = ious(track_tlbrs(atracks), track_tlbrs(btracks))
+    np.subtract(1, cost_matrix, out=cost_matrix)
 
     return cost_matrix
 
@@ -116,10 +188,12 @@ def real_iou_distance(atracks, btracks):
         atlbrs = atracks
         btlbrs = btracks
     else:
-        atlbrs = [track.tlwh_to_tlbr(track._tlwh) for track in atracks]
-        btlbrs = [track.tlwh_to_tlbr(track._tlwh) for track in btracks]
-    _ious = ious(atlbrs, btlbrs)
-    cost_matrix = 1 - _ious
+        atlbrs = np.asarray([track._tlwh for track in atracks], dtype=np.float32).reshape(-1, 4)
+        btlbrs = np.asarray([track._tlwh for track in btracks], dtype=np.float32).reshape(-1, 4)
+        atlbrs[:, 2:] += atlbrs[:, :2]
+        btlbrs[:, 2:] += btlbrs[:, :2]
+    cost_matrix = ious(atlbrs, btlbrs)
+    np.subtract(1, cost_matrix, out=cost_matrix)
 
     return cost_matrix
 
@@ -144,21 +218,49 @@ def v_iou_distance(atracks, btracks):
     return cost_matrix
 
 
-def embedding_distance(tracks, detections, metric='cosine'):
+def embedding_distance(tracks, detections, metric='cosine', mask=None):
     """
     :param tracks: list[STrack]
     :param detections: list[BaseTrack]
     :param metric:
+    :param mask: optional bool matrix of pairs already rejected (e.g. by the IoU proximity gate),
+        returned as the maximum cosine distance 2.0 without computing them
     :return: cost_matrix np.ndarray
     """
 
-    cost_matrix = np.zeros((len(tracks), len(detections)), dtype=np.float)
+    cost_matrix = np.zeros((len(tracks), len(detections)), dtype=np.float32)
     if cost_matrix.size == 0:
         return cost_matrix
-    det_features = np.asarray([track.curr_feat for track in detections], dtype=np.float)
-    track_features = np.asarray([track.smooth_feat for track in tracks], dtype=np.float)
+    det_features = np.asarray([track.curr_feat for track in detections], dtype=np.float32)
+
+    store, slots = _store_slots(tracks)
+    if mask is not None:
+        rows = np.flatnonzero(~mask.all(axis=1))
+        cols = np.flatnonzero(~mask.all(axis=0))
+        cost_matrix.fill(2.0)
+        if len(rows) == 0:
+            return cost_matrix
+        if store is not None:
+            slots = [slots[i] for i in rows]
+        tracks = [tracks[i] for i in rows]
+        det_features = det_features[cols]
+    if store is not None:
+        track_features = store.smooth_feat[slots]
+    else:
+        track_features = np.asarray([track.smooth_feat for track in tracks], dtype=np.float32)
+
+    if metric == 'cosine':
+        # Features are L2-normalised (STrack.update_features), so the cosine distance is 1 - dot product
+        dists = np.dot(track_features, det_features.T)
+        np.subtract(1, dists, out=dists)
+    else:
+        dists = cdist(track_features, det_features, metric).astype(np.float32)
+    np.maximum(0.0, dists, out=dists)  # / 2.0  # Nomalized features
 
-    cost_matrix = np.maximum(0.0, cdist(track_features, det_features, metric))  # / 2.0  # Nomalized features
+    if mask is None:
+        return dists
+    cost_matrix[np.ix_(rows, cols)] = dists
+    cost_matrix[mask] = 2.0
     return cost_matrix
 
 
@@ -208,9 +310,9 @@ def fuse_iou(cost_matrix, tracks, detections):
 def fuse_score(cost_matrix, detections):
     if cost_matrix.size == 0:
         return cost_matrix
-    iou_sim = 1 - cost_matrix
-    det_scores = np.array([det.score for det in detections])
-    det_scores = np.expand_dims(det_scores, axis=0).repeat(cost_matrix.shape[0], axis=0)
-    fuse_sim = iou_sim * det_scores
-    fuse_cost = 1 - fuse_sim
+    det_scores = np.array([det.score for det in detections], dtype=cost_matrix.dtype)
+    # 1 - iou_sim * det_scores, in a single output buffer
+    fuse_cost = np.subtract(1, cost_matrix)
+    fuse_cost *= det_scores[None, :]
+    np.subtract(1, fuse_cost, out=fuse_cost)
     return fuse_cost
\ No newline at end of file
@@ -0,0 +1,195 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_END = object()  # end of stream marker passed down the stages
+
+
+class Stage(object):
+    """
+    One step of a `Pipeline`: a function applied to every item, in order.
+
+    With `workers > 1` the function runs on a thread pool and the stage passes
+    futures downstream in submission order, so the next stage still sees the
+    items in order. With `batch_size > 1` the function is called with lists of
+    up to `batch_size` items and must return one result per item.
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=1, queue_size=8):
+        if workers > 1 and batch_size > 1:
+            raise ValueError("Stage {}: batched stages run on a single worker".format(name))
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.input = queue.Queue(maxsize=max(1, int(queue_size)))
+
+        # Statistics, read by Pipeline.occupancy
+        self.items = 0
+        self.busy = 0.0  # seconds spent in `fn`, summed over the workers
+        self.fill = 0  # input queue length, summed over the reads
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        t0 = time.perf_counter()
+        result = self.fn(item)
+        with self._lock:
+            self.busy += time.perf_counter() - t0
+            self.items += len(item) if self.batch_size > 1 else 1
+        return result
+
+
+class Pipeline(object):
+    """
+    Runs a chain of stages concurrently, one thread per stage, connected by
+    bounded queues.
+
+    Items of `source` are read in a thread of their own and flow through the
+    stages in order; iterating the pipeline yields the outputs of the last
+    stage, in source order. Wall-clock throughput is then bound by the slowest
+    stage instead of the sum of all stages. The first exception raised by a
+    stage stops every stage and is re-raised to the consumer.
+
+        pipeline = Pipeline(frames, queue_size=32)
+        pipeline.add('detect', detect, batch_size=4)
+        pipeline.add('render', render, workers=4)
+        for output in pipeline:
+            ...
+    """
+
+    def __init__(self, source, queue_size=8):
+        self.source = source
+        self.queue_size = queue_size
+        self.stages = []
+        self._output = None
+        self._stop = threading.Event()
+        self._error = None
+        self._start = None
+
+    def add(self, name, fn, workers=1, batch_size=1, queue_size=None):
+        """Append a stage, fed by a queue of `queue_size` items (default: the pipeline's). Returns the pipeline."""
+        self.stages.append(Stage(name, fn, workers, batch_size, queue_size or self.queue_size))
+        return self
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            # Items of pooled stages arrive as futures, in order
+            return item.result() if isinstance(item, Future) else item
+        return _END
+
+    def _fail(self, e):
+        if self._error is None:
+            self._error = e
+        self._stop.set()
+
+    def _feed(self, q):
+        try:
+            for item in self.source:
+                if not self._put(q, item):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(q, _END)
+
+    def _run(self, stage, output):
+        pool = ThreadPoolExecutor(stage.workers, thread_name_prefix=stage.name) if stage.workers > 1 else None
+        try:
+            done = False
+            while not done:
+                item = self._get(stage.input)
+                with stage._lock:
+                    stage.fill += stage.input.qsize()
+                    stage.reads += 1
+                if item is _END:
+                    break
+
+                if stage.batch_size > 1:
+                    batch = [item]
+                    while len(batch) < stage.batch_size:
+                        item = self._get(stage.input)
+                        if item is _END:
+                            done = True
+                            break
+                        batch.append(item)
+                    for result in stage(batch):
+                        if not self._put(output, result):
+                            return
+                elif pool is not None:
+                    if not self._put(output, pool.submit(stage, item)):
+                        return
+                elif not self._put(output, stage(item)):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(output, _END)
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+    def __iter__(self):
+        if not self.stages:
+            raise ValueError("Pipeline has no stage")
+        self._output = queue.Queue(maxsize=self.queue_size)
+        self._start = time.perf_counter()
+
+        outputs = [stage.input for stage in self.stages[1:]] + [self._output]
+        threads = [threading.Thread(target=self._feed, args=(self.stages[0].input,), name='source', daemon=True)]
+        threads += [threading.Thread(target=self._run, args=(stage, output), name=stage.name, daemon=True)
+                    for stage, output in zip(self.stages, outputs)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                try:
+                    item = self._get(self._output)
+                except BaseException as e:
+                    self._fail(e)
+                    break
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            if self._error is not None:
+                raise self._error
+
+    def occupancy(self):
+        """
+        Per stage statistics since the pipeline started: items processed, the
+        fraction of time its workers were busy, and the mean fill of its input
+        queue. The busiest stage is the bottleneck; a full queue in front of a
+        stage means the stages upstream are faster.
+        """
+        elapsed = max(1e-9, time.perf_counter() - self._start) if self._start is not None else 0.0
+        stats = {}
+        for stage in self.stages:
+            with stage._lock:
+                stats[stage.name] = {
+                    'items': stage.items,
+                    'busy': stage.busy / (elapsed * stage.workers) if elapsed else 0.0,
+                    'queue': stage.fill / max(1, stage.reads) / stage.input.maxsize,
+                }
+        return stats
+
+    def report(self):
+        """One line summary of `occupancy`."""
+        return ', '.join('{}: {:.0%} busy, queue {:.0%} full'.format(name, s['busy'], s['queue'])
+                         for name, s in self.occupancy().items())
@@ -0,0 +1,295 @@
+import os
+import os.path as osp
+import struct
+
+import numpy as np
+
+# Columns of the binary results format: name, dtype and shape of one row
+COLUMNS = (
+    ('frame', np.dtype('<i4'), ()),
+    ('id', np.dtype('<i4'), ()),
+    ('tlwh', np.dtype('<f4'), (4,)),
+    ('score', np.dtype('<f4'), ()),
+    ('cls', np.dtype('<i4'), ()),
+    ('player_id', np.dtype('<i4'), ()),
+)
+RESULTS_EXT = '.trk'
+
+# .npy header of every column file, padded to a fixed size so it can be rewritten in place as rows are appended
+_HEADER_SIZE = 128
+
+
+def is_binary_results(path):
+    """Whether `path` names results in the binary format, by its `.trk` suffix (any other directory is not one)."""
+    return osp.normpath(path).endswith(RESULTS_EXT)
+
+
+def _npy_header(dtype, shape):
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        np.lib.format.dtype_to_descr(dtype), shape)
+    header = header.ljust(_HEADER_SIZE - 11) + '\n'
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def _column_rows(path):
+    """Number of rows a column file holds according to its header."""
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        if f.tell() != _HEADER_SIZE:
+            raise ValueError("Error: {} is not a column of a results file".format(path))
+    return shape[0]
+
+
+class ResultWriter(object):
+    """
+    Streaming writer of the binary results format: a directory (`.trk`) with
+    one .npy file per column of `COLUMNS`, read back with `read_results`.
+
+    Rows are buffered and appended to the column files every `chunk_size`
+    rows, and the headers are updated after the data, so the files are
+    always valid arrays holding every flushed row. With `append`, rows are
+    added to an existing result (rows past the shortest column, left by an
+    interrupted flush, are dropped).
+    """
+
+    def __init__(self, path, chunk_size=4096, append=False):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._buffer = {name: [] for name, _, _ in COLUMNS}
+        self._buffered = 0
+        os.makedirs(path, exist_ok=True)
+
+        files = [osp.join(path, name + '.npy') for name, _, _ in COLUMNS]
+        self.rows = 0
+        if append and all(osp.exists(f) for f in files):
+            self.rows = min(_column_rows(f) for f in files)
+        self._files = {}
+        for (name, dtype, shape), filename in zip(COLUMNS, files):
+            f = open(filename, 'r+b' if append and osp.exists(filename) else 'w+b')
+            f.write(_npy_header(dtype, (self.rows,) + shape))
+            f.truncate(_HEADER_SIZE + self.rows * dtype.itemsize * int(np.prod(shape)))
+            self._files[name] = f
+
+    def add(self, frame, ids, tlwhs, scores=None, classes=None, player_ids=None):
+        """Add the tracks of one frame. `scores` default to 1 and `classes` and `player_ids` to -1."""
+        n = len(ids)
+        if n == 0:
+            return
+        columns = {
+            'frame': np.full(n, frame),
+            'id': ids,
+            'tlwh': np.reshape(tlwhs, (n, 4)),
+            'score': np.ones(n) if scores is None else scores,
+            'cls': np.full(n, -1) if classes is None else classes,
+            'player_id': np.full(n, -1) if player_ids is None else player_ids,
+        }
+        for name, dtype, shape in COLUMNS:
+            self._buffer[name].append(np.asarray(columns[name], dtype=dtype).reshape((n,) + shape))
+        self._buffered += n
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def add_rows(self, rows):
+        """Add rows in MOTChallenge layout (frame, id, x, y, w, h, score, ...), e.g. from `Results.to_rows`."""
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.size == 0:
+            return
+        for name, dtype, shape in COLUMNS:
+            if name == 'tlwh':
+                column = rows[:, 2:6]
+            elif name in ('frame', 'id', 'score'):
+                column = rows[:, {'frame': 0, 'id': 1, 'score': 6}[name]]
+            else:
+                column = np.full(len(rows), -1)
+            self._buffer[name].append(column.astype(dtype))
+        self._buffered += len(rows)
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffered == 0:
+            return
+        rows = self.rows + self._buffered
+        for name, dtype, shape in COLUMNS:
+            f = self._files[name]
+            f.seek(0, os.SEEK_END)
+            f.write(np.concatenate(self._buffer[name]).tobytes())
+            f.seek(0)
+            f.write(_npy_header(dtype, (rows,) + shape))
+            f.flush()
+            self._buffer[name] = []
+        self.rows = rows
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MOTWriter(object):
+    """Streaming writer of MOTChallenge text results, with the interface of `ResultWriter`."""
+
+    def __init__(self, path, decimals=2, append=False):
+        self.path = path
+        self.decimals = decimals
+        self._file = open(path, 'a' if append else 'w')
+
+    def add(self, frame, ids, tlwhs, scores=None, classes=None, player_ids=None):
+        d = self.decimals
+        if scores is None:
+            scores = np.ones(len(ids))
+        for tid, tlwh, score in zip(ids, tlwhs, scores):
+            self._file.write(f"{frame},{tid},{tlwh[0]:.{d}f},{tlwh[1]:.{d}f},{tlwh[2]:.{d}f},{tlwh[3]:.{d}f},{score:.2f},-1,-1,-1\n")
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(int(row[0]), [int(row[1])], [row[2:6]], [row[6]])
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_results(path, append=False, decimals=2, chunk_size=4096):
+    """Writer of results in the binary format for `.trk` paths, in MOTChallenge text otherwise."""
+    if is_binary_results(path):
+        return ResultWriter(path, chunk_size, append)
+    return MOTWriter(path, decimals, append)
+
+
+class Results(object):
+    """
+    Columns of a tracking result (see `COLUMNS`), as returned by
+    `read_results`. Columns of binary results are read-only memory maps of
+    the column files, so opening a result reads nothing but the headers.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['frame'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Results of rows in MOTChallenge layout (frame, id, x, y, w, h, score, ...)."""
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.size == 0:
+            rows = np.zeros((0, 10), dtype=np.float64)
+        columns = {
+            'frame': rows[:, 0].astype(np.int32),
+            'id': rows[:, 1].astype(np.int32),
+            'tlwh': rows[:, 2:6].astype(np.float32),
+            'score': rows[:, 6].astype(np.float32),
+            'cls': np.full(len(rows), -1, dtype=np.int32),
+            'player_id': np.full(len(rows), -1, dtype=np.int32),
+        }
+        return cls(columns)
+
+    def frame_dict(self, scores=True):
+        """Boxes by frame, {frame: [(tlwh, id, score)]} from frame 1, as `tracking_utils.io.read_mot_results` returns them."""
+        frames = {}
+        for frame, tlwh, track_id, score in zip(self['frame'].tolist(), self['tlwh'].tolist(), self['id'].tolist(),
+                                                self['score'].tolist()):
+            if frame < 1:
+                continue
+            frames.setdefault(frame, []).append((tuple(tlwh), track_id, score if scores else 1))
+        return frames
+
+    def to_rows(self):
+        """Rows in MOTChallenge layout (frame, id, x, y, w, h, score, -1, -1, -1), as float64."""
+        rows = np.full((len(self), 10), -1, dtype=np.float64)
+        rows[:, 0] = self['frame']
+        rows[:, 1] = self['id']
+        rows[:, 2:6] = self['tlwh']
+        rows[:, 6] = self['score']
+        return rows
+
+
+def read_mot_text(path):
+    rows = np.loadtxt(path, dtype=np.float64, delimiter=',', ndmin=2) if osp.getsize(path) else np.zeros((0, 10))
+    return Results.from_rows(rows)
+
+
+def read_results(path):
+    """Read results in the binary format (memory mapped) or in MOTChallenge text."""
+    if not is_binary_results(path):
+        return read_mot_text(path)
+    columns = {}
+    for name, _, _ in COLUMNS:
+        columns[name] = np.load(osp.join(path, name + '.npy'), mmap_mode='r')
+    # A result read while it is written may have columns of different lengths
+    n = min(len(column) for column in columns.values())
+    return Results({name: column[:n] for name, column in columns.items()})
+
+
+def mot_to_results(txt_path, path, chunk_size=4096):
+    """Convert MOTChallenge text results to the binary format."""
+    with ResultWriter(path, chunk_size) as writer:
+        writer.add_rows(read_mot_text(txt_path).to_rows())
+
+
+def results_to_mot(path, txt_path, decimals=2):
+    """Convert binary results to MOTChallenge text."""
+    results = read_results(path)
+    with MOTWriter(txt_path, decimals) as writer:
+        writer.add_rows(results.to_rows())
+
+
+def truncate_results(path, last_frame):
+    """Drop the rows of a result, written in frame order, after frame `last_frame` (e.g. to resume a run)."""
+    if not osp.exists(path):
+        return
+    if is_binary_results(path):
+        frames = read_results(path)['frame']
+        rows = int(np.searchsorted(frames, last_frame, side='right'))
+        del frames
+        for name, dtype, shape in COLUMNS:
+            with open(osp.join(path, name + '.npy'), 'r+b') as f:
+                f.write(_npy_header(dtype, (rows,) + shape))
+                f.truncate(_HEADER_SIZE + rows * dtype.itemsize * int(np.prod(shape)))
+        return
+    with open(path) as f:
+        rows = [row for row in f if int(row.split(',', 1)[0]) <= last_frame]
+    with open(path, 'w') as f:
+        f.writelines(rows)
+
+
+def write_results(filename, results):
+    """Write (frame_id, tlwhs, track_ids, scores) tuples, skipping negative ids, in the format of `filename`."""
+    if is_binary_results(filename):
+        with ResultWriter(filename) as writer:
+            for frame_id, tlwhs, track_ids, scores in results:
+                keep = [i for i, track_id in enumerate(track_ids) if track_id >= 0]
+                writer.add(frame_id, [track_ids[i] for i in keep], [tlwhs[i] for i in keep],
+                           [scores[i] for i in keep] if scores is not None else None)
+        return
+    save_format = '{frame},{id},{x1},{y1},{w},{h},{s},-1,-1,-1\n'
+    with open(filename, 'w') as f:
+        for frame_id, tlwhs, track_ids, scores in results:
+            for tlwh, track_id, score in zip(tlwhs, track_ids, scores):
+                if track_id < 0:
+                    continue
+                x1, y1, w, h = tlwh
+                line = save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1), w=round(w, 1),
+                                          h=round(h, 1), s=round(score, 2))
+                f.write(line)
@@ -0,0 +1,187 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from tracker import matching
+
+
+def split_segments(num_frames, length, overlap):
+    """
+    Split frames [0, num_frames) into segments of `length` frames, each one
+    starting `overlap` frames before the end of the previous one. Returns the
+    (start, stop) frame ranges.
+    """
+    if length <= overlap:
+        raise ValueError("Error: segments of {} frames cannot overlap by {} frames".format(length, overlap))
+    segments = []
+    start = 0
+    while True:
+        stop = min(start + length, num_frames)
+        segments.append((start, stop))
+        if stop >= num_frames:
+            return segments
+        start = stop - overlap
+
+
+def overlap_ious(rows_a, rows_b):
+    """
+    IoU of every pair of tracks of two results over the frames they share:
+    per-frame box IoUs summed over the frames where both tracks are present,
+    divided by the frames of the shorter track, so that tracks which only
+    meet briefly score low. Returns the ids of both sides and the
+    len(ids_a) x len(ids_b) matrix.
+    """
+    ids_a, inv_a = np.unique(rows_a[:, 1].astype(int), return_inverse=True)
+    ids_b, inv_b = np.unique(rows_b[:, 1].astype(int), return_inverse=True)
+    iou_sum = np.zeros((len(ids_a), len(ids_b)), dtype=np.float64)
+    frames_a = np.bincount(inv_a, minlength=len(ids_a)).astype(np.float64)
+    frames_b = np.bincount(inv_b, minlength=len(ids_b)).astype(np.float64)
+
+    for frame in np.intersect1d(rows_a[:, 0], rows_b[:, 0]):
+        in_a = np.flatnonzero(rows_a[:, 0] == frame)
+        in_b = np.flatnonzero(rows_b[:, 0] == frame)
+        boxes_a = rows_a[in_a, 2:6].copy()
+        boxes_b = rows_b[in_b, 2:6].copy()
+        boxes_a[:, 2:] += boxes_a[:, :2]
+        boxes_b[:, 2:] += boxes_b[:, :2]
+        cells = np.ix_(inv_a[in_a], inv_b[in_b])
+        iou_sum[cells] += matching.ious(boxes_a, boxes_b)
+
+    return ids_a, ids_b, iou_sum / np.maximum(np.minimum(frames_a[:, None], frames_b[None, :]), 1)
+
+
+def _features(features, part, ids, mapping=None):
+    """Appearance features of `ids` from a segment's head or tail features (None where missing)."""
+    if features is None or part not in features:
+        return None
+    known = {int(i): f for i, f in zip(features[part]['ids'], features[part]['features'])}
+    if mapping is not None:
+        known = {mapping.get(i, i): f for i, f in known.items()}
+    dim = len(features[part]['features'][0]) if len(known) else 0
+    out = np.zeros((len(ids), dim), dtype=np.float32)
+    found = np.zeros(len(ids), dtype=bool)
+    for k, i in enumerate(ids):
+        if int(i) in known:
+            out[k] = known[int(i)]
+            found[k] = True
+    return out, found
+
+
+def _in_window(rows, window):
+    return rows[(rows[:, 0] >= window[0]) & (rows[:, 0] < window[1])]
+
+
+def stitch_segments(segments, match_thresh=0.5, proximity_thresh=0.5, appearance_thresh=0.25,
+                    player_ids=True, id_penalty=0.1):
+    """
+    Merge the results of overlapping segments of a video, tracked separately,
+    into one result with consistent ids.
+
+    `segments` are dicts, in frame order, with the 'start' and 'stop' frames
+    of the segment, its result 'rows' (see `tracker.results.Results.to_rows`) and optionally the
+    'features' of its tracklets: {'head': {'ids', 'features'}, 'tail': ...},
+    mean appearance features over the first and last frames.
+
+    At each boundary, the tracks of both segments are matched over the
+    overlap window by their mean IoU (see `overlap_ious`), fused with the
+    cosine distance of their features as BoTSORT fuses ReID, and by
+    agreement of their ids when the ids are player ids. Matched tracks of the
+    next segment take the id of their match; the others keep their id when
+    `player_ids`, or get a new one. Each segment then contributes its rows up
+    to the middle of the overlaps. Negative ids are left as they are.
+    """
+    if not segments:
+        return np.zeros((0, 10), dtype=np.float64)
+    prev, mapping = None, {}
+    # New ids are numbered after the player ids, so they never take one
+    next_id = 1 + max([-1] + [int(s['rows'][:, 1].max()) for s in segments if len(s['rows'])]) if player_ids else 0
+    merged = []
+    for k, segment in enumerate(segments):
+        rows = segment['rows']
+        local_ids = np.unique(rows[:, 1].astype(int))
+        local_ids = local_ids[local_ids >= 0]
+        new_mapping = {}
+        if prev is not None and prev['stop'] > segment['start']:
+            window = (segment['start'], prev['stop'])
+            rows_a = _in_window(prev['mapped'], window)
+            rows_b = _in_window(rows, window)
+            rows_a, rows_b = rows_a[rows_a[:, 1] >= 0], rows_b[rows_b[:, 1] >= 0]
+            ids_a, ids_b, ious = overlap_ious(rows_a, rows_b)
+            cost = 1 - ious
+
+            feats_a = _features(prev.get('features'), 'tail', ids_a, mapping)
+            feats_b = _features(segment.get('features'), 'head', ids_b)
+            if feats_a is not None and feats_b is not None and feats_a[0].shape[1] == feats_b[0].shape[1] > 0:
+                emb = np.maximum(0.0, cdist(feats_a[0], feats_b[0], 'cosine')) / 2.0
+                emb[~feats_a[1]] = 1.0
+                emb[:, ~feats_b[1]] = 1.0
+                emb[emb > appearance_thresh] = 1.0
+                emb[cost > proximity_thresh] = 1.0
+                cost = np.minimum(cost, emb)
+            if player_ids and id_penalty > 0:
+                cost = cost + id_penalty * (ids_a[:, None] != ids_b[None, :])
+
+            matches, _, _ = matching.linear_assignment(cost, thresh=match_thresh)
+            new_mapping = {int(ids_b[ib]): int(ids_a[ia]) for ia, ib in matches}
+
+        taken = set(new_mapping.values())
+        for i in local_ids:
+            i = int(i)
+            if i in new_mapping:
+                continue
+            if player_ids and i not in taken:
+                new_mapping[i] = i
+            else:
+                new_mapping[i] = next_id
+                next_id += 1
+            taken.add(new_mapping[i])
+
+        mapped = rows.copy()
+        ids = mapped[:, 1].astype(int)
+        mapped[:, 1] = [new_mapping.get(i, i) for i in ids]
+
+        # Each segment covers frames up to the middle of its overlaps
+        first = (segment['start'] + prev['stop']) // 2 if prev is not None else -np.inf
+        last = (segments[k + 1]['start'] + segment['stop']) // 2 if k + 1 < len(segments) else np.inf
+        merged.append(mapped[(mapped[:, 0] >= first) & (mapped[:, 0] < last)])
+
+        prev = dict(segment, mapped=mapped)
+        mapping = new_mapping
+
+    rows = np.concatenate(merged)
+    return rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+
+
+class TrackletFeatures(object):
+    """
+    Appearance features of the tracklets at both ends of a segment, for
+    `stitch_segments`: the last smoothed feature of every track seen in the
+    first `window` frames (head) and in the last `window` frames (tail).
+    """
+
+    def __init__(self, start, window):
+        self.start = start
+        self.window = window
+        self.head = {}
+        self.tail = {}  # track id -> (last frame, feature)
+        self.last_frame = start - 1
+
+    def update(self, frame_id, tracks):
+        self.last_frame = frame_id
+        for t in tracks:
+            feat = t.smooth_feat
+            if feat is None:
+                continue
+            if frame_id < self.start + self.window:
+                self.head[t.track_id] = feat.copy()
+            self.tail[t.track_id] = (frame_id, feat.copy())
+
+    def state_dict(self):
+        tail = {i: f for i, (frame_id, f) in self.tail.items() if frame_id > self.last_frame - self.window}
+        return {'head': self._arrays(self.head), 'tail': self._arrays(tail)}
+
+    @staticmethod
+    def _arrays(features):
+        ids = np.array(sorted(features), dtype=np.int64)
+        dim = len(next(iter(features.values()))) if features else 0
+        feats = np.array([features[i] for i in ids], dtype=np.float32).reshape(len(ids), dim)
+        return {'ids': ids, 'features': feats}
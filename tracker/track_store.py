@@ -0,0 +1,297 @@
+import numpy as np
+
+from tracker.basetrack import TrackState
+
+
+class TrackStore(object):
+    """
+    Contiguous struct-of-arrays storage for the Kalman state of live tracks.
+
+    Every activated track owns one slot (row) of the store. Means and
+    covariances are kept as Nx8 and Nx8x8 arrays so that prediction, camera
+    motion compensation and correction can run on all tracks at once, in
+    place, instead of gathering and scattering per-object arrays every frame.
+    Slots of removed tracks are returned to a free list and reused.
+
+    Each slot also holds a float16 ring buffer with the last `history_depth`
+    appearance features of its track (0 disables the history).
+    """
+
+    def __init__(self, capacity=64, history_depth=50):
+        self.capacity = 0
+        self.history_depth = history_depth
+        self._free = []
+        self.clear(capacity)
+
+    def clear(self, capacity=64, history_depth=None):
+        """Drop every slot and reallocate empty columns."""
+        self.capacity = 0
+        if history_depth is not None:
+            self.history_depth = max(0, int(history_depth))
+        self._free = []
+
+        self.mean = np.zeros((0, 8), dtype=np.float64)
+        self.covariance = np.zeros((0, 8, 8), dtype=np.float64)
+        self.tlbr = np.zeros((0, 4), dtype=np.float32)
+        self.smooth_feat = np.zeros((0, 0), dtype=np.float32)
+        self.has_smooth_feat = np.zeros((0,), dtype=bool)
+        self.history = np.zeros((0, self.history_depth, 0), dtype=np.float16)
+        self.history_count = np.zeros((0,), dtype=np.int64)
+        self.state = np.zeros((0,), dtype=np.int8)
+        self.is_activated = np.zeros((0,), dtype=bool)
+        self.score = np.zeros((0,), dtype=np.float64)
+        self.frame_id = np.zeros((0,), dtype=np.int64)
+        self.start_frame = np.zeros((0,), dtype=np.int64)
+        self.in_use = np.zeros((0,), dtype=bool)
+
+        self._grow(capacity)
+
+    def __len__(self):
+        return int(self.in_use.sum())
+
+    def _columns(self):
+        return ['mean', 'covariance', 'tlbr', 'smooth_feat', 'has_smooth_feat', 'history', 'history_count',
+                'state', 'is_activated', 'score', 'frame_id', 'start_frame', 'in_use']
+
+    def _grow(self, capacity):
+        if capacity <= self.capacity:
+            return
+        for name in self._columns():
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.state[self.capacity:] = TrackState.New
+
+        # Pop from the end, so the lowest free slot is handed out first
+        self._free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def allocate(self):
+        """Reserve a slot and return its index."""
+        if not self._free:
+            self._grow(max(1, 2 * self.capacity))
+        slot = self._free.pop()
+        self.in_use[slot] = True
+        return slot
+
+    def release(self, slot):
+        """Return a slot to the free list."""
+        if not self.in_use[slot]:
+            return
+        self.in_use[slot] = False
+        self.has_smooth_feat[slot] = False
+        self.history_count[slot] = 0
+        self.state[slot] = TrackState.Removed
+        self._free.append(slot)
+
+    def reserve_features(self, dim):
+        """Size the embedding matrix for `dim` dimensional features, on first use."""
+        if self.smooth_feat.shape[1] == dim:
+            return
+        self.smooth_feat = np.zeros((self.capacity, dim), dtype=np.float32)
+        self.has_smooth_feat[:] = False
+        self.history = np.zeros((self.capacity, self.history_depth, dim), dtype=np.float16)
+        self.history_count[:] = 0
+
+    def push_feature(self, slot, feat):
+        """Append a feature to the history ring buffer of a slot, overwriting the oldest one when full."""
+        if self.history_depth == 0:
+            return
+        self.reserve_features(len(feat))
+        self.history[slot, self.history_count[slot] % self.history_depth] = feat
+        self.history_count[slot] += 1
+
+    def recent_features(self, slot, k=None):
+        """The last `k` (default: all kept) features of a slot, oldest first, as a float32 array."""
+        n = min(self.history_count[slot], self.history_depth)
+        if k is not None:
+            n = min(n, k)
+        end = self.history_count[slot] % max(1, self.history_depth)
+        rows = np.arange(end - n, end) % max(1, self.history_depth)
+        return self.history[slot, rows].astype(np.float32)
+
+    def mean_feature(self, slot, k=None):
+        """L2-normalised mean of the last `k` features of a slot, or None without history."""
+        feats = self.recent_features(slot, k)
+        if len(feats) == 0:
+            return None
+        feat = feats.mean(axis=0)
+        return feat / np.linalg.norm(feat)
+
+    def medoid_feature(self, slot, k=None):
+        """The feature among the last `k` of a slot with the highest total cosine similarity to the others."""
+        feats = self.recent_features(slot, k)
+        if len(feats) == 0:
+            return None
+        return feats[np.argmax(np.dot(feats, feats.T).sum(axis=1))]
+
+    def active_slots(self):
+        return np.flatnonzero(self.in_use)
+
+    def refresh_boxes(self, slots):
+        """Recompute the cached `(min x, min y, max x, max y)` boxes of the given slots from their means."""
+        xywh = self.mean[slots, :4]
+        tl = xywh[..., :2] - xywh[..., 2:] / 2
+        self.tlbr[slots, :2] = tl
+        self.tlbr[slots, 2:] = tl + xywh[..., 2:]
+
+
+class StoreField(object):
+    """
+    Track attribute that lives in a `TrackStore` column once the track owns a
+    slot, and in the instance dict before that (e.g. for detections).
+    `on_set` names a store method called with the slot after each assignment.
+    """
+
+    def __init__(self, default=None, on_set=None):
+        self.default = default
+        self.on_set = on_set
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, track, owner=None):
+        if track is None:
+            return self
+        if track._slot is None:
+            return track.__dict__.get(self.name, self.default)
+        value = getattr(track._store, self.name)[track._slot]
+        # Vectors and matrices are returned as views into the store
+        return value if value.ndim else value.item()
+
+    def __set__(self, track, value):
+        if track._slot is None:
+            track.__dict__[self.name] = value
+        else:
+            getattr(track._store, self.name)[track._slot] = value
+            if self.on_set is not None:
+                getattr(track._store, self.on_set)(track._slot)
+
+
+class FeatureField(StoreField):
+    """
+    StoreField for an optional embedding. Rows of the store column are only
+    valid where the matching `has_<name>` flag is set, and read as None otherwise.
+    """
+
+    def __get__(self, track, owner=None):
+        if track is None:
+            return self
+        if track._slot is None:
+            return track.__dict__.get(self.name, self.default)
+        store = track._store
+        if not getattr(store, 'has_' + self.name)[track._slot]:
+            return None
+        return getattr(store, self.name)[track._slot]
+
+    def __set__(self, track, value):
+        if track._slot is None:
+            track.__dict__[self.name] = value
+            return
+        store = track._store
+        if value is not None:
+            store.reserve_features(len(value))
+            getattr(store, self.name)[track._slot] = value
+        getattr(store, 'has_' + self.name)[track._slot] = value is not None
+
+
+class TrackArchive(object):
+    """
+    Bounded archive of removed tracks.
+
+    Instead of keeping every removed STrack alive, only a compact record is
+    kept per track (id, start/end frame, frame of removal and final embedding)
+    in fixed-size ring arrays. Ids of archived tracks are counted in a dict so
+    membership checks stay O(1). Records are dropped when the ring is full or
+    when they are older than `retention` frames (0 keeps them until overwritten).
+    """
+
+    def __init__(self, capacity=1024, retention=0):
+        self.capacity = max(1, int(capacity))
+        self.retention = max(0, int(retention))
+
+        self.track_id = np.full((self.capacity,), -1, dtype=np.int64)
+        self.start_frame = np.zeros((self.capacity,), dtype=np.int64)
+        self.end_frame = np.zeros((self.capacity,), dtype=np.int64)
+        self.removed_frame = np.zeros((self.capacity,), dtype=np.int64)
+        self.feature = np.zeros((self.capacity, 0), dtype=np.float32)
+        self.has_feature = np.zeros((self.capacity,), dtype=bool)
+
+        self._head = 0  # oldest record
+        self._size = 0
+        self._ids = {}
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, track_id):
+        return track_id in self._ids
+
+    def _drop_oldest(self):
+        tid = int(self.track_id[self._head])
+        self._ids[tid] -= 1
+        if self._ids[tid] == 0:
+            del self._ids[tid]
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+
+    def add(self, track, frame_id):
+        """Archive a removed track."""
+        if self._size == self.capacity:
+            self._drop_oldest()
+        i = (self._head + self._size) % self.capacity
+        self._size += 1
+
+        self.track_id[i] = track.track_id
+        self.start_frame[i] = track.start_frame
+        self.end_frame[i] = track.end_frame
+        self.removed_frame[i] = frame_id
+        feat = getattr(track, 'smooth_feat', None)
+        if feat is not None:
+            if self.feature.shape[1] != len(feat):
+                self.feature = np.zeros((self.capacity, len(feat)), dtype=np.float32)
+                self.has_feature[:] = False
+            self.feature[i] = feat
+        self.has_feature[i] = feat is not None
+        self._ids[track.track_id] = self._ids.get(track.track_id, 0) + 1
+
+    def expire(self, frame_id):
+        """Drop the records removed more than `retention` frames before `frame_id`."""
+        if self.retention == 0:
+            return
+        while self._size and frame_id - self.removed_frame[self._head] > self.retention:
+            self._drop_oldest()
+
+    def records(self):
+        """Indices of the archived records, oldest first."""
+        return (self._head + np.arange(self._size)) % self.capacity
+
+    def state_dict(self):
+        """Copy of the archive, see `BoTSORT.state_dict`."""
+        return {
+            'capacity': self.capacity,
+            'retention': self.retention,
+            'track_id': self.track_id.copy(),
+            'start_frame': self.start_frame.copy(),
+            'end_frame': self.end_frame.copy(),
+            'removed_frame': self.removed_frame.copy(),
+            'feature': self.feature.copy(),
+            'has_feature': self.has_feature.copy(),
+            'head': self._head,
+            'size': self._size,
+        }
+
+    def load_state_dict(self, state):
+        """Restore an archive saved by `state_dict`."""
+        self.capacity = int(state['capacity'])
+        self.retention = int(state['retention'])
+        for name in ('track_id', 'start_frame', 'end_frame', 'removed_frame', 'feature', 'has_feature'):
+            setattr(self, name, np.array(state[name], dtype=getattr(self, name).dtype))
+        self._head = int(state['head'])
+        self._size = int(state['size'])
+        self._ids = {}
+        for i in self.records():
+            tid = int(self.track_id[i])
+            self._ids[tid] = self._ids.get(tid, 0) + 1
@@ -4,7 +4,7 @@ import copy
 import motmetrics as mm
 mm.lap.default_solver = 'lap'
 
-from yolox.tracking_utils.io import read_results, unzip_objs
+from tracker.tracking_utils.io import MOT_DTYPE, MOTFrames, load_mot, read_results, unzip_objs
 
 
 class Evaluator(object):
@@ -21,8 +21,10 @@ class Evaluator(object):
         assert self.data_type == 'mot'
 
         gt_filename = os.path.join(self.data_root, self.seq_name, 'gt', 'gt.txt')
-        self.gt_frame_dict = read_results(gt_filename, self.data_type, is_gt=True)
-        self.gt_ignore_frame_dict = read_results(gt_filename, self.data_type, is_ignore=True)
+        # One (cached) parse of the file for both the ground truth and the ignored boxes
+        gt = load_mot(gt_filename) if os.path.isfile(gt_filename) else MOTFrames(np.zeros(0, dtype=MOT_DTYPE))
+        self.gt_frames = gt.gt(gt_filename)
+        self.gt_ignore_frames = gt.ignored(gt_filename)
 
     def reset_accumulator(self):
         self.acc = mm.MOTAccumulator(auto_id=True)
@@ -33,12 +35,10 @@ class Evaluator(object):
         trk_ids = np.copy(trk_ids)
 
         # gts
-        gt_objs = self.gt_frame_dict.get(frame_id, [])
-        gt_tlwhs, gt_ids = unzip_objs(gt_objs)[:2]
+        gt_tlwhs, gt_ids = self.gt_frames.boxes(frame_id)
 
         # ignore boxes
-        ignore_objs = self.gt_ignore_frame_dict.get(frame_id, [])
-        ignore_tlwhs = unzip_objs(ignore_objs)[0]
+        ignore_tlwhs = self.gt_ignore_frames.boxes(frame_id)[0]
 
         # remove ignored results
         keep = np.ones(len(trk_tlwhs), dtype=bool)
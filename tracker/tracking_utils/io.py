@@ -2,6 +2,8 @@ import os
 from typing import Dict
 import numpy as np
 
+from tracker.results import is_binary_results, read_results as read_binary_results
+
 
 def write_results(filename, results_dict: Dict, data_type: str):
     if not filename:
@@ -57,53 +59,139 @@ labels={'ped', ...			% 1
 """
 
 
-def read_mot_results(filename, is_gt, is_ignore):
-    valid_labels = {1}
-    ignore_labels = {2, 7, 8, 12}
-    results_dict = dict()
-    if os.path.isfile(filename):
-        with open(filename, 'r') as f:
-            for line in f.readlines():
-                linelist = line.split(',')
-                if len(linelist) < 7:
-                    continue
-                fid = int(linelist[0])
-                if fid < 1:
-                    continue
-                results_dict.setdefault(fid, list())
-
-                box_size = float(linelist[4]) * float(linelist[5])
-
-                if is_gt:
-                    if 'MOT16-' in filename or 'MOT17-' in filename:
-                        label = int(float(linelist[7]))
-                        mark = int(float(linelist[6]))
-                        if mark == 0 or label not in valid_labels:
-                            continue
-                    score = 1
-                elif is_ignore:
-                    if 'MOT16-' in filename or 'MOT17-' in filename:
-                        label = int(float(linelist[7]))
-                        vis_ratio = float(linelist[8])
-                        if label not in ignore_labels and vis_ratio >= 0:
-                            continue
-                    else:
-                        continue
-                    score = 1
-                else:
-                    score = float(linelist[6])
-
-                #if box_size > 7000:
-                #if box_size <= 7000 or box_size >= 15000:
-                #if box_size < 15000:
-                    #continue
-
-                tlwh = tuple(map(float, linelist[2:6]))
-                target_id = int(linelist[1])
-
-                results_dict[fid].append((tlwh, target_id, score))
-
-    return results_dict
+# Rows of a MOTChallenge text file: frame, id, box, then the confidence (or the "consider" mark of
+# ground truth), the class label and the visibility ratio of ground truth (-1 when absent)
+MOT_DTYPE = np.dtype([('frame', '<i4'), ('id', '<i4'), ('tlwh', '<f8', (4,)), ('score', '<f8'),
+                      ('label', '<i4'), ('vis', '<f8')])
+VALID_LABELS = (1,)
+IGNORE_LABELS = (2, 7, 8, 12)
+
+
+class MOTFrames(object):
+    """
+    Rows of a MOTChallenge file (see `MOT_DTYPE`), sorted by frame, with the
+    row range of every frame: the rows of `frames[i]` are
+    `rows[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows[np.argsort(rows['frame'], kind='stable')]
+        self.frames = np.unique(self.rows['frame'])
+        self.offsets = np.searchsorted(self.rows['frame'], np.append(self.frames, np.iinfo(np.int32).max))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def frame(self, frame_id):
+        """Rows of frame `frame_id` (a view)."""
+        i = np.searchsorted(self.frames, frame_id)
+        if i == len(self.frames) or self.frames[i] != frame_id:
+            return self.rows[:0]
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+    def boxes(self, frame_id):
+        """tlwh boxes and ids of frame `frame_id`, as `unzip_objs` returns them."""
+        rows = self.frame(frame_id)
+        return rows['tlwh'], rows['id']
+
+    def select(self, mask):
+        return MOTFrames(self.rows[mask])
+
+    def gt(self, filename):
+        """Ground truth boxes from frame 1, without the boxes not to consider (MOT16/17: mark 0 or not pedestrian)."""
+        keep = self.rows['frame'] >= 1
+        if 'MOT16-' in filename or 'MOT17-' in filename:
+            keep &= (self.rows['score'].astype(int) != 0) & np.isin(self.rows['label'], VALID_LABELS)
+        return self.select(keep)
+
+    def ignored(self, filename):
+        """Ground truth boxes to ignore from frame 1 (MOT16/17: ignored classes or negative visibility, none otherwise)."""
+        keep = np.zeros(len(self.rows), dtype=bool)
+        if 'MOT16-' in filename or 'MOT17-' in filename:
+            keep = (self.rows['frame'] >= 1) & (np.isin(self.rows['label'], IGNORE_LABELS) | (self.rows['vis'] < 0))
+        return self.select(keep)
+
+    def to_dict(self, scores=True, frames=None):
+        """{frame: [(tlwh, id, score)]} of the frames from 1, scores set to 1 without `scores`."""
+        results_dict = {int(frame): [] for frame in (self.frames if frames is None else frames) if frame >= 1}
+        for frame, target_id, tlwh, score in zip(self.rows['frame'].tolist(), self.rows['id'].tolist(),
+                                                 self.rows['tlwh'].tolist(), self.rows['score'].tolist()):
+            if frame >= 1:
+                results_dict[frame].append((tuple(tlwh), target_id, score if scores else 1))
+        return results_dict
+
+
+def _parse_mot_lines(filename):
+    """Slow path of `parse_mot_file`, line by line, for files with rows of different lengths."""
+    rows = []
+    with open(filename, 'r') as f:
+        for line in f:
+            linelist = line.split(',')
+            if len(linelist) < 7:
+                continue
+            values = [float(v) for v in linelist[:9]]
+            rows.append(values + [-1.] * (9 - len(values)))
+    return np.array(rows, dtype=np.float64).reshape(-1, 9)
+
+
+def parse_mot_file(filename):
+    """Parse a MOTChallenge text file in one `np.loadtxt` call, into `MOT_DTYPE` rows."""
+    try:
+        values = np.loadtxt(filename, dtype=np.float64, delimiter=',', ndmin=2) if os.path.getsize(filename) else np.zeros((0, 9))
+        if values.size and values.shape[1] < 7:
+            values = np.zeros((0, 9))
+    except ValueError:
+        values = _parse_mot_lines(filename)
+    if values.shape[1] < 9:
+        values = np.hstack([values, np.full((len(values), 9 - values.shape[1]), -1.)])
+
+    rows = np.zeros(len(values), dtype=MOT_DTYPE)
+    rows['frame'] = values[:, 0]
+    rows['id'] = values[:, 1]
+    rows['tlwh'] = values[:, 2:6]
+    rows['score'] = values[:, 6]
+    rows['label'] = values[:, 7]
+    rows['vis'] = values[:, 8]
+    return rows
+
+
+def load_mot(filename, cache=True):
+    """
+    `MOTFrames` of a MOTChallenge text file. With `cache`, the parsed rows are
+    saved next to the file (`<filename>.npz`) and reused while the file is
+    unchanged (same size and modification time).
+    """
+    stat = os.stat(filename)
+    cache_file = filename + '.npz'
+    if cache and os.path.isfile(cache_file):
+        with np.load(cache_file, allow_pickle=False) as cached:
+            if cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size and cached['rows'].dtype == MOT_DTYPE:
+                return MOTFrames(cached['rows'])
+
+    rows = parse_mot_file(filename)
+    if cache:
+        try:
+            tmp_file = cache_file + '.tmp.npz'
+            np.savez(tmp_file, rows=rows, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass  # read-only dataset
+    return MOTFrames(rows)
+
+
+def read_mot_results(filename, is_gt, is_ignore, cache=False):
+    if is_binary_results(filename):
+        # Binary results (tracker/results.py) have no labels to filter on
+        return {} if is_ignore else read_binary_results(filename).frame_dict(scores=not is_gt)
+    if not os.path.isfile(filename):
+        return dict()
+
+    mot = load_mot(filename, cache)
+    if is_gt:
+        return mot.gt(filename).to_dict(scores=False, frames=mot.frames)
+    if is_ignore:
+        return mot.ignored(filename).to_dict(scores=False, frames=mot.frames)
+    return mot.to_dict()
 
 
 def unzip_objs(objs):
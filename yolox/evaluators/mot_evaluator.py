@@ -15,6 +15,7 @@ from yolox.utils import (
     xyxy2xywh
 )
 
+from tracker.results import write_results
 from trackers.bot_sort_tracker.bot_sort import BoTSORT
 from trackers.byte_tracker.byte_tracker import BYTETracker
 from trackers.sort_tracker.sort import Sort
@@ -30,19 +31,6 @@ import tempfile
 import time
 
 
-def write_results(filename, results):
-    save_format = '{frame},{id},{x1},{y1},{w},{h},{s},-1,-1,-1\n'
-    with open(filename, 'w') as f:
-        for frame_id, tlwhs, track_ids, scores in results:
-            for tlwh, track_id, score in zip(tlwhs, track_ids, scores):
-                if track_id < 0:
-                    continue
-                x1, y1, w, h = tlwh
-                line = save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1), w=round(w, 1), h=round(h, 1), s=round(score, 2))
-                f.write(line)
-    logger.info('save results to {}'.format(filename))
-
-
 def write_results_no_score(filename, results):
     save_format = '{frame},{id},{x1},{y1},{w},{h},-1,-1,-1,-1\n'
     with open(filename, 'w') as f:
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import numpy as np
+import torch
+
+from .boxes import postprocess
+from .demo_utils import demo_postprocess, postprocess_numpy
+
+__all__ = ["TorchBackend", "ONNXBackend"]
+
+
+class TorchBackend(object):
+    """
+    Detector backend running a PyTorch (or torch2trt) YOLOX module.
+
+    Backends are called with a preprocessed B x 3 x H x W float32 batch (numpy
+    array or CPU tensor) and return, per image, None or a tensor of
+    (x1, y1, x2, y2, obj_conf, class_conf, class_pred) rows, like postprocess.
+    """
+
+    def __init__(self, model, num_classes, confthre, nmsthre, device=torch.device("cpu"), fp16=False, decoder=None):
+        self.model = model
+        self.num_classes = num_classes
+        self.confthre = confthre
+        self.nmsthre = nmsthre
+        self.device = device
+        self.fp16 = fp16
+        self.decoder = decoder
+
+    def __call__(self, batch):
+        batch = torch.as_tensor(batch).to(self.device, non_blocking=True)
+        if self.fp16:
+            batch = batch.half()  # to FP16
+
+        with torch.no_grad():
+            outputs = self.model(batch)
+            if self.decoder is not None:
+                outputs = self.decoder(outputs, dtype=outputs.type())
+            return postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
+
+
+class ONNXBackend(object):
+    """
+    Detector backend running a YOLOX model exported by tools/export_onnx.py with
+    onnxruntime, so that no GPU (nor PyTorch model) is needed.
+
+    Box decoding and NMS run in numpy. The detections are wrapped in tensors
+    without a copy, so callers see the same outputs as with TorchBackend.
+    Models exported with a fixed batch size are run in chunks of that size.
+    """
+
+    def __init__(self, model_path, num_classes, confthre, nmsthre, test_size,
+                 intra_op_threads=0, inter_op_threads=0, providers=None, io_binding=True, p6=False):
+        import onnxruntime
+
+        self.num_classes = num_classes
+        self.confthre = confthre
+        self.nmsthre = nmsthre
+        self.test_size = test_size
+        self.p6 = p6
+
+        # 0 lets onnxruntime pick the number of threads
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        if providers is None:
+            providers = onnxruntime.get_available_providers()
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=providers)
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        self.max_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        self.binding = self.session.io_binding() if io_binding else None
+
+    def _run(self, batch):
+        if self.binding is None:
+            return self.session.run([self.output_name], {self.input_name: batch})[0]
+
+        # Bind the host batch directly, and let onnxruntime allocate the output
+        self.binding.bind_cpu_input(self.input_name, batch)
+        self.binding.bind_output(self.output_name)
+        self.session.run_with_iobinding(self.binding)
+        return self.binding.copy_outputs_to_cpu()[0]
+
+    def __call__(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        step = self.max_batch or len(batch)
+        outputs = [self._run(batch[i:i + step]) for i in range(0, len(batch), step)]
+        outputs = outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+        outputs = demo_postprocess(outputs, self.test_size, self.p6)
+        outputs = postprocess_numpy(outputs, self.num_classes, self.confthre, self.nmsthre)
+        return [None if output is None else torch.from_numpy(output) for output in outputs]
@@ -6,7 +6,7 @@ import numpy as np
 
 import os
 
-__all__ = ["mkdir", "nms", "multiclass_nms", "demo_postprocess"]
+__all__ = ["mkdir", "nms", "multiclass_nms", "demo_postprocess", "batched_nms", "postprocess_numpy"]
 
 
 def mkdir(path):
@@ -94,3 +94,75 @@ def demo_postprocess(outputs, img_size, p6=False):
     outputs[..., 2:4] = np.exp(outputs[..., 2:4]) * expanded_strides
 
     return outputs
+
+
+def batched_nms(boxes, scores, idxs, nms_thr):
+    """
+    Per-class NMS implemented in Numpy, with the semantics of torchvision.ops.batched_nms
+    (continuous coordinates, boxes of different classes never suppress each other).
+    Returns the indices of the kept boxes, by decreasing score.
+    """
+    if len(boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+
+    # Shift the boxes of each class apart, so a single NMS pass never mixes them
+    offsets = idxs.astype(boxes.dtype) * (boxes.max() + 1)
+    boxes = boxes + offsets[:, None]
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort(kind="stable")[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+
+        inter = np.maximum(0.0, xx2 - xx1) * np.maximum(0.0, yy2 - yy1)
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+
+        inds = np.where(ovr <= nms_thr)[0]
+        order = order[inds + 1]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess_numpy(prediction, num_classes, conf_thre=0.7, nms_thre=0.45):
+    """
+    Numpy version of yolox.utils.postprocess, for decoded (cx, cy, w, h, obj, cls...)
+    predictions of shape B x N x (5 + num_classes). Returns, per image, None or an
+    array of (x1, y1, x2, y2, obj_conf, class_conf, class_pred) rows.
+    """
+    output = [None for _ in range(len(prediction))]
+    for i, image_pred in enumerate(prediction):
+
+        # If none are remaining => process next image
+        if not image_pred.shape[0]:
+            continue
+
+        # Get score and class with highest confidence
+        class_scores = image_pred[:, 5: 5 + num_classes]
+        class_pred = class_scores.argmax(1)
+        class_conf = class_scores[np.arange(len(class_scores)), class_pred]
+
+        conf_mask = image_pred[:, 4] * class_conf >= conf_thre
+        if not conf_mask.any():
+            continue
+        image_pred = image_pred[conf_mask]
+
+        detections = np.empty((len(image_pred), 7), dtype=np.float32)
+        detections[:, 0] = image_pred[:, 0] - image_pred[:, 2] / 2
+        detections[:, 1] = image_pred[:, 1] - image_pred[:, 3] / 2
+        detections[:, 2] = image_pred[:, 0] + image_pred[:, 2] / 2
+        detections[:, 3] = image_pred[:, 1] + image_pred[:, 3] / 2
+        detections[:, 4] = image_pred[:, 4]
+        detections[:, 5] = class_conf[conf_mask]
+        detections[:, 6] = class_pred[conf_mask]
+
+        keep = batched_nms(detections[:, :4], detections[:, 4] * detections[:, 5], class_pred[conf_mask], nms_thre)
+        output[i] = detections[keep]
+
+    return output